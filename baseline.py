@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from processing import bucket_means, hourly_buckets
+
+# Weather drivers of the baseline, hourly means of the readings
+BASELINE_FEATURES = ["TEMP_OUT", "HUMID_OUT", "TEMP_GATE", "HUMID_GATE"]
+
+LINEAR = "linear"
+CHANGE_POINT = "change_point"  # adds a cooling degree term max(TEMP_OUT - balance point, 0)
+MODELS = [CHANGE_POINT, LINEAR]
+# Balance points tried by the change-point model, as quantiles of the hourly TEMP_OUT
+BALANCE_QUANTILES = np.linspace(0.1, 0.9, 9)
+
+# ASHRAE Guideline 14 calibration limits for hourly models, in percent
+MAX_CV_RMSE = 30.0
+MAX_NMBE = 10.0
+
+
+def hourly_table(df, system_ids, features=BASELINE_FEATURES):
+    # One row per hour: mean weather of its readings and the hourly kWh of every system
+    order, starts, sizes, times, codes = hourly_buckets(df["Time_stamp"])
+    weather = bucket_means(df[features].to_numpy(dtype="float64"), order, starts)
+    # _KW_SUM_Average already holds the hour's mean on each of its readings, the first one is enough
+    kwh = df[[f"{system_id}_KW_SUM_Average" for system_id in system_ids]].to_numpy(dtype="float64")[order[starts]]
+    return pd.DatetimeIndex(times), weather, kwh
+
+
+def design_matrices(times, weather, balance_points=None, temperature_column=0):
+    # (models, hours, parameters): intercept, standardized weather, hour-of-day and weekday dummies, and for a
+    # change-point model one cooling degree term per candidate balance point
+    valid = np.isfinite(weather).all(axis=1)
+    mean = weather[valid].mean(axis=0) if valid.any() else np.zeros(weather.shape[1])
+    std = weather[valid].std(axis=0) if valid.any() else np.ones(weather.shape[1])
+    std[std == 0] = 1.0
+    scaled = np.where(valid[:, None], (weather - mean) / std, 0.0)
+
+    hours = np.eye(24)[times.hour.to_numpy()][:, 1:]
+    weekdays = np.eye(7)[times.dayofweek.to_numpy()][:, 1:]
+    base = np.hstack([np.ones((len(times), 1)), scaled, hours, weekdays])
+    if balance_points is None:
+        return base[None], valid
+
+    temperature = np.where(valid, weather[:, temperature_column], 0.0)
+    degrees = np.maximum(temperature[None, :] - balance_points[:, None], 0.0) / std[temperature_column]
+    stacked = np.broadcast_to(base, (len(balance_points),) + base.shape)
+    return np.concatenate([stacked, degrees[:, :, None]], axis=2), valid
+
+
+def _solve(X, y):
+    # Normal equations of every candidate model and system in one batched product, pinv leaves the
+    # dummies of hours or weekdays never seen before the installation at 0
+    Xt = X.transpose(0, 2, 1)
+    return np.linalg.pinv(Xt @ X) @ (Xt @ y)
+
+
+def _empty_result(system_id, installation_date, model, message):
+    return {
+        "system": system_id, "installation_date": str(pd.Timestamp(installation_date).date()), "model": model,
+        "balance_point": None, "train_hours": 0, "predict_hours": 0, "cv_rmse": None, "nmbe": None,
+        "meets_guideline": False, "baseline_kwh": None, "actual_kwh": None, "avoided_kwh": None, "savings": None,
+        "daily": None, "message": message,
+    }
+
+
+def baseline_savings(df, installation_dates, model=CHANGE_POINT, features=BASELINE_FEATURES):
+    # Pre-installation kWh regressed on weather, hour of day and weekday, the fit predicts what the Post
+    # period would have used. Systems sharing an installation date are solved together as one multi-column
+    # least squares, every change-point candidate in the same batch.
+    system_ids = list(installation_dates)
+    times, weather, kwh = hourly_table(df, system_ids, features)
+    complete = np.isfinite(weather).all(axis=1)
+
+    balance_points = None
+    if model == CHANGE_POINT and complete.any():
+        balance_points = np.unique(np.quantile(weather[complete, features.index("TEMP_OUT")], BALANCE_QUANTILES))
+    X, valid = design_matrices(times, weather, balance_points, features.index("TEMP_OUT"))
+    # A balance point is fitted too
+    parameters = X.shape[2] + (balance_points is not None)
+
+    groups = {}
+    for system_id, installation_date in installation_dates.items():
+        groups.setdefault(pd.Timestamp(installation_date), []).append(system_id)
+
+    results = {}
+    for installation_date, group in groups.items():
+        columns = [system_ids.index(system_id) for system_id in group]
+        y = kwh[:, columns]
+        usable = valid & np.isfinite(y).all(axis=1)
+        # installation_period() makes readings after the installation date Post: an hour is Post once its end is
+        # past the date, so the training hours hold Pre readings only and the hour of the installation is predicted
+        post = (times + pd.Timedelta(hours=1)).to_numpy() > np.datetime64(installation_date)
+        train, test = usable & ~post, usable & post
+        if train.sum() <= parameters:
+            for system_id in group:
+                results[system_id] = _empty_result(system_id, installation_date, model,
+                                                   f"Only {train.sum()} Pre Installation hours with weather readings, "
+                                                   f"the baseline needs more than {parameters}")
+            continue
+
+        coefficients = _solve(X[:, train], y[train])
+        residuals = y[train][None] - X[:, train] @ coefficients
+        # Best candidate per system by its own training error
+        best = (residuals ** 2).sum(axis=1).argmin(axis=0)
+
+        for j, system_id in enumerate(group):
+            candidate = best[j]
+            result = _empty_result(system_id, installation_date, model, None)
+            result["balance_point"] = None if balance_points is None else float(balance_points[candidate])
+            result["train_hours"], result["predict_hours"] = int(train.sum()), int(test.sum())
+
+            # Fit statistics as in ASHRAE Guideline 14, with n - p degrees of freedom
+            error = residuals[candidate, :, j]
+            mean = y[train, j].mean()
+            dof = train.sum() - parameters
+            if mean:
+                result["cv_rmse"] = float(np.sqrt((error ** 2).sum() / dof) / mean * 100)
+                result["nmbe"] = float(error.sum() / (dof * mean) * 100)
+                result["meets_guideline"] = bool(result["cv_rmse"] <= MAX_CV_RMSE and abs(result["nmbe"]) <= MAX_NMBE)
+
+            predicted = X[candidate][usable] @ coefficients[candidate, :, j]
+            result["daily"] = pd.DataFrame({
+                "date": times[usable].normalize(),
+                "Installation_Type": np.where(post[usable], "Post Installation", "Pre Installation"),
+                "baseline_kwh": predicted,
+                "actual_kwh": y[usable, j],
+            }).groupby(["date", "Installation_Type"], as_index=False).sum()
+
+            if not test.any():
+                result["message"] = "No Post Installation hours with weather readings to compare against the baseline"
+            else:
+                baseline_kwh = float(predicted[post[usable]].sum())
+                actual_kwh = float(y[test, j].sum())
+                result["baseline_kwh"], result["actual_kwh"] = baseline_kwh, actual_kwh
+                result["avoided_kwh"] = baseline_kwh - actual_kwh
+                result["savings"] = result["avoided_kwh"] / baseline_kwh * 100 if baseline_kwh else None
+            results[system_id] = result
+    return results
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from data_store import MONTHS, load_frame, project_files
+from processing import TEMPERATURE_BINS, add_m_round_columns, add_system_sums, build_system_cubes
+from project_registry import REGISTRY_FILE, ProjectRegistry
+from savings import savings_estimate
+
+DEFAULT_M_ROUND = 0.5
+# Report columns, written even when no project is registered
+SAVINGS_COLUMNS = ["project", "system", "installation_date", "analysis", "pre_kwh", "post_kwh", "pre_points", "post_points",
+                   "savings", "savings_low", "savings_high", "normalized_savings", "normalized_low", "normalized_high",
+                   "bins", "resamples", "confidence", "message"]
+TIMING_COLUMNS = ["project", "seconds", "systems", "error"]
+
+
+def load_project(project_path, start=None, end=None, exclude_months=(), exclude_dates=()):
+    json_path, _ = project_files(project_path)
+    with open(json_path, "r") as json_file_data:
+        data = json.load(json_file_data)
+    return data, load_frame(project_path, start, end, exclude_months, exclude_dates)
+
+
+def project_savings(project_name, project_path, m_round=DEFAULT_M_ROUND, start=None, end=None, exclude_months=(), exclude_dates=()):
+    # Same pipeline as pages/analysis.py with the full temperature range; excluded months and dates apply to
+    # every system and are never read, there are no per-system deselections
+    data, df = load_project(project_path, start, end, exclude_months, exclude_dates)
+    df = add_system_sums(df, data)
+
+    rows = []
+    for system_id in [key for key in data if key.startswith("System")]:
+        installation_date = data.get(f"Installation Date {system_id}")
+        if installation_date is None:
+            continue
+        columns = ["Time_stamp", "Hour", "date", "TEMP_OUT", "TEMP_GATE", f"{system_id}_KW_SUM_Average"]
+        df_system = add_m_round_columns(df[columns], m_round, installation_date)
+        cubes = build_system_cubes(df_system, system_id)
+        for bin_column in TEMPERATURE_BINS:
+            # The page's default slider spans every binned temperature, which leaves out NaN readings
+            summary = savings_estimate(cubes[bin_column], bin_column)
+            rows.append({
+                "project": project_name,
+                "system": system_id,
+                "installation_date": installation_date,
+                "analysis": bin_column.replace(" M_ROUND", ""),
+                **summary,
+            })
+    return rows
+
+
+def _run_project(project_name, project_path, m_round, period_start=None, period_end=None, exclude_months=(), exclude_dates=()):
+    start = time.perf_counter()
+    try:
+        rows = project_savings(project_name, project_path, m_round, period_start, period_end, exclude_months, exclude_dates)
+        error = None
+    except Exception as e:
+        rows = []
+        error = f"{type(e).__name__}: {e}"
+    return project_name, rows, time.perf_counter() - start, error
+
+
+def run_batch(registry_path, m_round=DEFAULT_M_ROUND, workers=None, period_start=None, period_end=None,
+              exclude_months=(), exclude_dates=()):
+    registry = ProjectRegistry(registry_path)
+    root = registry.root
+    projects = registry.project_names()
+
+    results = []
+    timings = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_run_project, project_name, os.path.join(root, project_name), m_round, period_start, period_end,
+                            exclude_months, exclude_dates)
+            for project_name in projects
+        ]
+        for future in as_completed(futures):
+            project_name, rows, seconds, error = future.result()
+            results.extend(rows)
+            timings.append({"project": project_name, "seconds": round(seconds, 3), "systems": len({row["system"] for row in rows}), "error": error})
+    return pd.DataFrame(results, columns=SAVINGS_COLUMNS), pd.DataFrame(timings, columns=TIMING_COLUMNS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute Pre/Post installation savings for every saved project")
+    parser.add_argument("--registry", default=REGISTRY_FILE, help="project registry, project folders are resolved next to it")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--format", choices=["csv", "json", "both"], default="both")
+    parser.add_argument("--m-round", type=float, default=DEFAULT_M_ROUND)
+    parser.add_argument("--start", help="first day to analyse (YYYY-MM-DD), only the segments in range are read")
+    parser.add_argument("--end", help="last day to analyse (YYYY-MM-DD)")
+    parser.add_argument("--exclude-months", nargs="+", default=[], choices=MONTHS, metavar="MONTH",
+                        help="month names to leave out, e.g. December January; their segments are not read")
+    parser.add_argument("--exclude-dates", nargs="+", default=[], metavar="DATE",
+                        help="days to leave out (YYYY-MM-DD), skipped with the segments' row group statistics")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size, defaults to the CPU count")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    # Inclusive dates on the command line, the loader takes an exclusive end
+    period_start = pd.Timestamp(args.start) if args.start else None
+    period_end = pd.Timestamp(args.end) + pd.Timedelta(days=1) if args.end else None
+    exclude_dates = [pd.Timestamp(day) for day in args.exclude_dates]
+    savings, timings = run_batch(args.registry, args.m_round, args.workers, period_start, period_end,
+                                 args.exclude_months, exclude_dates)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.format in ("csv", "both"):
+        savings.to_csv(os.path.join(args.output_dir, "savings.csv"), index=False)
+        timings.to_csv(os.path.join(args.output_dir, "timings.csv"), index=False)
+    if args.format in ("json", "both"):
+        savings.to_json(os.path.join(args.output_dir, "savings.json"), orient="records", indent=2)
+        timings.to_json(os.path.join(args.output_dir, "timings.json"), orient="records", indent=2)
+
+    for timing in timings.sort_values("seconds", ascending=False).itertuples():
+        status = f"failed ({timing.error})" if timing.error else f"{timing.systems} systems"
+        print(f"{timing.project}: {timing.seconds:.2f}s, {status}")
+    print(f"{len(timings)} projects in {time.perf_counter() - start:.2f}s")
+    return 1 if timings["error"].notna().any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from baseline import baseline_savings
+from data_store import add_calendar_columns, ensure_cache, load_frame, memory_report
+from ingest import TIME_STAMP_FORMAT
+from processing import (TEMPERATURE_BINS, add_m_round_columns, add_system_sums, assignment_matrix, build_filter_codes,
+                        build_system_cubes, circuit_block, circuit_sums, cube_pivot, deselect_mask, filtered_view,
+                        hourly_averages, hourly_buckets)
+from savings import savings_estimate
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Excel sheets stop at 1,048,576 rows, larger datasets are benchmarked from CSV only
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def synthetic_frame(rows, circuits=16, systems=4, years=1, seed=0):
+    # Meter readings spread evenly over the requested years, in the upload header contract
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-01-01")
+    step = pd.Timedelta(days=365 * years) / rows
+    time_stamps = pd.DatetimeIndex(start + step * np.arange(rows))
+
+    hours = time_stamps.hour.to_numpy() + time_stamps.minute.to_numpy() / 60
+    daily = np.sin((hours - 6) / 24 * 2 * np.pi)
+    df = pd.DataFrame({"TIME_STAMP": time_stamps.strftime(TIME_STAMP_FORMAT)})
+    for circuit in range(1, circuits + 1):
+        df[f"C_{circuit}"] = np.round(5 + 3 * daily + rng.normal(0, 1, rows), 4)
+    df["TEMP_OUT"] = np.round(28 + 6 * daily + rng.normal(0, 1.5, rows), 1)
+    df["HUMID_OUT"] = np.round(70 - 10 * daily + rng.normal(0, 5, rows))
+    df["TEMP_GATE"] = np.round(23 + 2 * daily + rng.normal(0, 0.5, rows), 1)
+    df["HUMID_GATE"] = np.round(65 - 5 * daily + rng.normal(0, 3, rows))
+
+    installation_date = str((start + pd.Timedelta(days=365 * years) / 2).date())
+    circuit_names = [f"C_{circuit}" for circuit in range(1, circuits + 1)]
+    data = {}
+    for system, group in enumerate(np.array_split(circuit_names, systems), start=1):
+        data[f"Installation Date System {system}"] = installation_date
+        data[f"System {system}"] = list(group)
+    return df, data
+
+
+def write_workbook(df, path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append(row)
+    workbook.save(path)
+
+
+def column_memory(legacy, compact):
+    # memory_report rows before and after the compact schema side by side, columns missing from one side are null
+    report = legacy.join(compact, how="outer", lsuffix="_legacy", rsuffix="_compact")
+    report = report.sort_values(["mb_legacy", "mb_compact"], ascending=False)
+    return {column: {key: None if pd.isna(value) else (round(value, 3) if isinstance(value, float) else value)
+                     for key, value in row.items()} for column, row in report.to_dict("index").items()}
+
+
+def legacy_frame(df):
+    # Layout before the compact schema: float64 readings, raw timestamp text, string calendar columns
+    legacy = df.copy()
+    time_stamp = pd.to_datetime(legacy["TIME_STAMP"], format=TIME_STAMP_FORMAT)
+    legacy["Time_stamp"] = time_stamp
+    legacy["Hour"] = time_stamp.dt.hour
+    legacy["week_day"] = time_stamp.dt.day_name().astype(object)
+    legacy["date"] = time_stamp.dt.date
+    legacy["day"] = time_stamp.dt.day
+    legacy["month"] = time_stamp.dt.month_name().astype(object)
+    return legacy
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.stages[stage] = round(time.perf_counter() - start, 4)
+        return result
+
+
+def run_pipeline(timer, df, data, m_round=0.5):
+    system_ids = [key for key in data if key.startswith("System")]
+    buckets = timer("hourly_buckets", hourly_buckets, df["Time_stamp"])
+    # The two kernels of add_system_sums on their own: circuit block times assignment matrix, then the
+    # hourly _KW_SUM_Average; system_sums is the whole step as the dataset cache runs it on a reassignment
+    def system_sum():
+        circuits, block = circuit_block(df)
+        return circuit_sums(block, assignment_matrix(circuits, data)[1])
+    sums = timer("system_sum", system_sum)
+    timer("kw_sum_average", hourly_averages, sums, buckets)
+    df = timer("system_sums", add_system_sums, df, data, buckets)
+
+    system_id = system_ids[0]
+    filter_codes = timer("filter_codes", build_filter_codes, df)
+    mask = timer("filtering", lambda: deselect_mask(filter_codes, {"Hour": [0, 1], "week_day": ["Sunday"]}))
+    df_filtered = filtered_view(df, mask, ["Time_stamp", "Hour", "date", "TEMP_OUT", "TEMP_GATE", f"{system_id}_KW_SUM_Average"])
+
+    df_filtered = timer("m_round_binning", add_m_round_columns, df_filtered, m_round, data[f"Installation Date {system_id}"])
+    cubes = timer("aggregate_cube", build_system_cubes, df_filtered, system_id)
+    timer("pivot", lambda: [cube_pivot(cubes[bin_column], bin_column) for bin_column in TEMPERATURE_BINS])
+    timer("savings_bootstrap", lambda: [savings_estimate(cubes[bin_column], bin_column) for bin_column in TEMPERATURE_BINS])
+    # Every system of the project in one batched fit
+    timer("baseline_fit", baseline_savings, df, {key: data[f"Installation Date {key}"] for key in system_ids})
+
+
+def benchmark_size(label, rows, work_dir, circuits, systems, years, excel_max_rows):
+    df, data = synthetic_frame(rows, circuits, systems, years)
+    timer = StageTimer()
+
+    # One project folder per upload format, ingested like the app does: month spill, then merge and dedup into segments
+    csv_project = os.path.join(work_dir, f"{label}_csv")
+    os.makedirs(csv_project)
+    df.to_csv(os.path.join(csv_project, "data.csv"), index=False)
+    timer("csv_ingest", ensure_cache, csv_project)
+
+    if rows <= excel_max_rows:
+        xlsx_project = os.path.join(work_dir, f"{label}_xlsx")
+        os.makedirs(xlsx_project)
+        xlsx_path = os.path.join(xlsx_project, "data.xlsx")
+        write_workbook(df, xlsx_path)
+        timer("excel_load", pd.read_excel, xlsx_path)
+        timer("excel_ingest", ensure_cache, xlsx_project)
+
+    legacy = memory_report(legacy_frame(df))
+    # Part of the ingest above, timed on its own as well
+    timer("timestamp_parse", add_calendar_columns, df.copy())
+    df = timer("segment_load", load_frame, csv_project)
+    compact = memory_report(df)
+    memory = {
+        "legacy_mb": round(legacy["mb"].sum(), 2),
+        "compact_mb": round(compact["mb"].sum(), 2),
+        "columns": column_memory(legacy, compact),
+    }
+    run_pipeline(timer, df, data)
+
+    return {"label": label, "rows": rows, "circuits": circuits, "systems": systems, "years": years,
+            "stages": timer.stages, "memory": memory}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each analysis stage on synthetic meter datasets")
+    parser.add_argument("--sizes", nargs="+", default=["10k", "1m"], help=f"any of {', '.join(SIZES)} or a row count")
+    parser.add_argument("--circuits", type=int, default=16)
+    parser.add_argument("--systems", type=int, default=4)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--excel-max-rows", type=int, default=100_000, help="largest dataset also written and timed as .xlsx")
+    parser.add_argument("--memory-report", action="store_true", help="also print the per-column memory before and after")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "runs": [],
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="energy_benchmark_")
+    try:
+        for size in args.sizes:
+            rows = SIZES.get(size.lower()) or int(size)
+            run = benchmark_size(size, rows, work_dir, args.circuits, args.systems, args.years, min(args.excel_max_rows, EXCEL_MAX_ROWS))
+            results["runs"].append(run)
+            print(f"{size} ({rows} rows)")
+            for stage, seconds in run["stages"].items():
+                print(f"  {stage:<16}{seconds:>10.4f}s")
+            print(f"  memory          {run['memory']['legacy_mb']:.1f} MB -> {run['memory']['compact_mb']:.1f} MB")
+            if args.memory_report:
+                for column, usage in run["memory"]["columns"].items():
+                    legacy = "-" if usage["dtype_legacy"] is None else f"{usage['dtype_legacy']} {usage['mb_legacy']:.2f} MB"
+                    compact = "-" if usage["dtype_compact"] is None else f"{usage['dtype_compact']} {usage['mb_compact']:.2f} MB"
+                    print(f"    {column:<16}{legacy:>24} -> {compact}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# Above this many points per series a chart is downsampled before it is serialized
+MAX_POINTS = 400
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps first/last point and the most visually significant point per bucket
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    edges = np.linspace(1, n - 1, threshold - 1).astype("int64")
+
+    indices = np.empty(threshold, dtype="int64")
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
+
+
+def _numeric_axis(values):
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype="float64")
+    return pd.to_datetime(values).to_numpy().astype("datetime64[s]").astype("float64")
+
+
+def downsample(df, x_column, y_column, threshold=MAX_POINTS, group_column=None):
+    df = df.dropna(subset=[x_column, y_column])
+    if group_column is None:
+        groups = [df]
+    else:
+        groups = [group for _, group in df.groupby(group_column, sort=False, observed=True)]
+
+    if all(len(group) <= threshold for group in groups):
+        return df
+
+    sampled = []
+    for group in groups:
+        group = group.sort_values(x_column)
+        keep = lttb_indices(_numeric_axis(group[x_column]), group[y_column].to_numpy(dtype="float64"), threshold)
+        sampled.append(group.iloc[keep])
+    return pd.concat(sampled, ignore_index=True)
+
+
+def chart_spec(chart):
+    # Serialized once per filter state and memoized, Streamlit re-sends the dict as is
+    return chart.to_dict()
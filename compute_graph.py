@@ -0,0 +1,44 @@
+import time
+
+import pandas as pd
+import streamlit as st
+
+# Latest (inputs, value) per node, kept per session across reruns
+MEMO_KEY = "_compute_graph_memo"
+REPORT_KEY = "_compute_graph_report"
+
+RECOMPUTED = "recomputed"
+REUSED = "reused"
+
+
+def start_rerun():
+    st.session_state[REPORT_KEY] = []
+
+
+def node(name, inputs, compute):
+    # inputs must be hashable-comparable and include the inputs of upstream nodes
+    memo = st.session_state.setdefault(MEMO_KEY, {})
+    report = st.session_state.setdefault(REPORT_KEY, [])
+
+    entry = memo.get(name)
+    if entry is not None and entry[0] == inputs:
+        report.append((name, REUSED, 0.0))
+        return entry[1]
+
+    start = time.perf_counter()
+    value = compute()
+    memo[name] = (inputs, value)
+    report.append((name, RECOMPUTED, time.perf_counter() - start))
+    return value
+
+
+def rerun_report():
+    report = st.session_state.get(REPORT_KEY, [])
+    return pd.DataFrame(report, columns=["node", "status", "seconds"])
+
+
+def show_report():
+    report = rerun_report()
+    recomputed = int((report["status"] == RECOMPUTED).sum())
+    with st.expander(f"Recompute report: {recomputed} of {len(report)} nodes recomputed"):
+        st.dataframe(report)
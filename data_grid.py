@@ -0,0 +1,75 @@
+import html
+
+import numpy as np
+import pandas as pd
+
+# Same anchors as the old Matplotlib colormap, interpolated into a fixed palette
+GRADIENT = [(0, 128, 0), (255, 255, 0), (255, 165, 0), (255, 0, 0)]
+COLOR_BINS = 32
+
+
+def _palette(anchors, bins):
+    positions = np.linspace(0, len(anchors) - 1, bins)
+    low = np.floor(positions).astype(int).clip(0, len(anchors) - 2)
+    weight = (positions - low)[:, None]
+    anchors = np.asarray(anchors, dtype="float64")
+    rgb = np.rint(anchors[low] * (1 - weight) + anchors[low + 1] * weight).astype(int)
+    backgrounds = [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb]
+    # Dark text on light cells, light text on dark ones
+    luminance = (0.299 * rgb[:, 0] + 0.587 * rgb[:, 1] + 0.114 * rgb[:, 2]) / 255
+    texts = np.where(luminance > 0.5, "#000000", "#f1f1f1")
+    return backgrounds, list(texts)
+
+
+PALETTE, TEXT_COLORS = _palette(GRADIENT, COLOR_BINS)
+
+
+def column_ranges(df):
+    # Global min/max per numeric column, computed once per dataset instead of per page
+    ranges = {}
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]):
+            values = df[column].to_numpy(dtype="float64", na_value=np.nan)
+            if np.isnan(values).all():
+                continue
+            ranges[column] = (np.nanmin(values), np.nanmax(values))
+    return ranges
+
+
+def color_bins(values, low, high, bins=COLOR_BINS):
+    values = pd.Series(values).to_numpy(dtype="float64", na_value=np.nan)
+    span = high - low
+    scaled = (values - low) / span if span > 0 else np.zeros_like(values)
+    codes = np.rint(np.clip(scaled, 0, 1) * (bins - 1))
+    return np.where(np.isnan(values), -1, codes).astype(int)
+
+
+def _format(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT or value is pd.NA:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.4f}".rstrip("0").rstrip(".")
+    return html.escape(str(value))
+
+
+def grid_html(page, ranges, height=600):
+    columns = list(page.columns)
+    codes = {column: color_bins(page[column], *ranges[column]) for column in columns if column in ranges}
+
+    header = "".join(f"<th>{html.escape(str(column))}</th>" for column in columns)
+    rows = []
+    cells_by_column = [page[column].tolist() for column in columns]
+    for i in range(len(page)):
+        cells = []
+        for column, values in zip(columns, cells_by_column):
+            code = codes[column][i] if column in codes else -1
+            style = f' style="background:{PALETTE[code]};color:{TEXT_COLORS[code]}"' if code >= 0 else ""
+            cells.append(f"<td{style}>{_format(values[i])}</td>")
+        rows.append(f"<tr><td class='grid-index'>{page.index[i]}</td>{''.join(cells)}</tr>")
+
+    return (
+        f"<div style='max-height:{height}px;overflow:auto'>"
+        "<table style='border-collapse:collapse;font-size:0.8rem;white-space:nowrap'>"
+        f"<thead><tr><th></th>{header}</tr></thead>"
+        f"<tbody>{''.join(rows)}</tbody></table></div>"
+    )
@@ -0,0 +1,436 @@
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows, the cache is not locked there
+    fcntl = None
+
+from ingest import SUPPORTED_EXTENSIONS, TIME_STAMP_FORMAT, iter_chunks
+
+# Parsed copy of the uploaded files lives next to them in the project folder, one Parquet segment per month
+CACHE_DIR = ".cache"
+SEGMENTS_DIR = "segments"
+CACHE_META_FILE = "meta.json"
+# Columns, row count, time range, per-column stats and filter values, read by the dialogs and widgets instead of the data
+CATALOG_FILE = "catalog.json"
+CACHE_LOCK_FILE = "lock"
+# Segments are sorted by time, so each row group covers a narrow span for the reader's min/max pruning
+SEGMENT_ROW_GROUP = 10000
+# Rows whose timestamp could not be parsed
+UNDATED_SEGMENT = "undated"
+# Single-file cache written before segments
+LEGACY_CACHE_FILES = ["data.parquet"]
+
+
+class SourceError(ValueError):
+    # A data file that could not be merged into the segments, the message names the file
+    def __init__(self, source_path, error):
+        super().__init__(f"{os.path.basename(source_path)}: {type(error).__name__}: {str(error).strip()}")
+        self.source_path = source_path
+
+
+def source_files(project_name):
+    # Every data file uploaded to the project, in the order they were ingested, new ones last by upload time
+    names = [file for file in os.listdir(project_name) if file.lower().endswith(SUPPORTED_EXTENSIONS)]
+    meta = _read_meta(_cache_paths(project_name)[2]) or {}
+    ingested = [source["source"] for source in meta.get("sources", []) if source["source"] in names]
+    new = sorted((name for name in names if name not in ingested), key=lambda name: (os.path.getmtime(f"{project_name}/{name}"), name))
+    if not ingested and not new:
+        raise FileNotFoundError(f"No data file in {project_name}")
+    return [f"{project_name}/{name}" for name in ingested + new]
+
+
+def project_files(project_name):
+    json_file = [file for file in os.listdir(project_name) if file.endswith('.json')]
+    return f"{project_name}/{json_file[0]}", source_files(project_name)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+# Bumped whenever the cached column layout changes, older caches are rebuilt
+SCHEMA_VERSION = 3
+
+
+def add_calendar_columns(df):
+    # Compact layout: small nullable ints, fixed categoricals and int32 day ordinals instead of
+    # strings and datetime.date objects; the raw TIME_STAMP text is dropped once parsed
+    time_stamp = pd.to_datetime(df.pop('TIME_STAMP'), format=TIME_STAMP_FORMAT, errors='coerce')
+    df['Time_stamp'] = time_stamp
+    df["Hour"] = time_stamp.dt.hour.astype("Int8")
+    df["week_day"] = pd.Categorical(time_stamp.dt.day_name(), categories=WEEK_DAYS)
+    df["date"] = date_ordinals(time_stamp)
+    df["day"] = time_stamp.dt.day.astype("Int8")
+    df["month"] = pd.Categorical(time_stamp.dt.month_name(), categories=MONTHS)
+    return df
+
+
+def date_ordinals(time_stamps):
+    # Days since 1970-01-01, <NA> for unparsed timestamps
+    days = pd.Series(time_stamps).to_numpy().astype("datetime64[D]")
+    ordinals = pd.array(days.astype("int64"), dtype="Int32") if len(days) else pd.array([], dtype="Int32")
+    ordinals[np.isnat(days)] = pd.NA
+    return ordinals
+
+
+def ordinal_dates(ordinals):
+    # Back to datetime.date values for display
+    days = pd.array(ordinals, dtype="Int32").to_numpy(dtype="float64", na_value=np.nan)
+    return pd.to_datetime(days, unit="D").date
+
+
+def memory_report(df):
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({"dtype": df.dtypes.astype(str), "mb": usage / 1024 ** 2})
+    return report.sort_values("mb", ascending=False)
+
+
+def _cache_paths(project_name):
+    cache_dir = f"{project_name}/{CACHE_DIR}"
+    return cache_dir, f"{cache_dir}/{SEGMENTS_DIR}", f"{cache_dir}/{CACHE_META_FILE}"
+
+
+def _catalog_path(project_name):
+    return f"{project_name}/{CACHE_DIR}/{CATALOG_FILE}"
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, "r") as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _source_stat(source_path):
+    stat = os.stat(source_path)
+    return {"source": os.path.basename(source_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "w") as meta_file:
+        meta_file.write(json.dumps(meta))
+    os.replace(tmp_path, meta_path)
+
+
+@contextmanager
+def _cache_lock(project_name):
+    # The ingest workers and the dashboard may reach the same project at once
+    cache_dir, _, _ = _cache_paths(project_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f"{cache_dir}/{CACHE_LOCK_FILE}", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _source_unchanged(recorded, source_path):
+    stat = _source_stat(source_path)
+    # Size and mtime unchanged means the file is the one we hashed last time
+    if recorded.get("size") == stat["size"] and recorded.get("mtime") == stat["mtime"]:
+        return True
+    # Re-saved copy of the same upload: keep the segments and remember the new stat
+    if recorded.get("sha256") == file_hash(source_path):
+        recorded.update(stat)
+        return True
+    return False
+
+
+def _ingest_plan(project_name):
+    # (meta to extend, sources still to ingest, whether a recorded stat was refreshed); a changed or removed
+    # file means a full rebuild
+    sources = source_files(project_name)
+    meta = _read_meta(_cache_paths(project_name)[2])
+    if meta is None or meta.get("schema") != SCHEMA_VERSION:
+        return None, sources, False
+    by_name = {os.path.basename(path): path for path in sources}
+    refreshed = False
+    for recorded in meta["sources"]:
+        path = by_name.get(recorded["source"])
+        before = dict(recorded)
+        if path is None or not _source_unchanged(recorded, path):
+            return None, sources, False
+        refreshed = refreshed or recorded != before
+    ingested = {recorded["source"] for recorded in meta["sources"]}
+    return meta, [path for path in sources if os.path.basename(path) not in ingested], refreshed
+
+
+def pending_sources(project_name):
+    return _ingest_plan(project_name)[1]
+
+
+def ingested_sources(project_name):
+    # File names already merged into the segments, empty when the next ensure_cache rebuilds from scratch
+    meta = _ingest_plan(project_name)[0]
+    return [] if meta is None else [source["source"] for source in meta["sources"]]
+
+
+def _month_keys(time_stamps):
+    months = time_stamps.to_numpy().astype("datetime64[M]")
+    return np.where(np.isnat(months), UNDATED_SEGMENT, months.astype(str))
+
+
+def _segment_path(segments_dir, key):
+    return f"{segments_dir}/{key}.parquet"
+
+
+def _append_source(project_name, meta, source_path, progress=None):
+    cache_dir, segments_dir, meta_path = _cache_paths(project_name)
+    parts_dir = f"{cache_dir}/parts-{os.getpid()}"
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    # Pass 1: stream the file and spill each chunk's rows into per-month parts
+    total_rows = 0
+    part_count = {}
+    for chunk in iter_chunks(source_path, os.path.basename(source_path)):
+        chunk = add_calendar_columns(chunk)
+        for key, rows in chunk.groupby(_month_keys(chunk["Time_stamp"]), sort=False):
+            os.makedirs(f"{parts_dir}/{key}", exist_ok=True)
+            rows.to_parquet(f"{parts_dir}/{key}/{part_count.get(key, 0)}.parquet", index=False)
+            part_count[key] = part_count.get(key, 0) + 1
+        total_rows += len(chunk)
+        if progress is not None:
+            progress(total_rows)
+    if total_rows == 0:
+        raise ValueError("The uploaded file has no data rows")
+
+    # Pass 2: merge only the months this file touches with their existing segment
+    os.makedirs(segments_dir, exist_ok=True)
+    try:
+        _merge_parts(meta, segments_dir, parts_dir, part_count)
+    except BaseException:
+        # Some segments may hold this file's rows already, the next ensure_cache rebuilds them all
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        raise
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    recorded = _source_stat(source_path)
+    recorded["sha256"] = file_hash(source_path)
+    meta["sources"].append(recorded)
+    _write_meta(meta_path, meta)
+    return total_rows
+
+
+def _merge_parts(meta, segments_dir, parts_dir, part_count):
+    for key, parts in part_count.items():
+        segment_path = _segment_path(segments_dir, key)
+        frames = [pd.read_parquet(segment_path)] if key in meta["segments"] else []
+        frames += [pd.read_parquet(f"{parts_dir}/{key}/{i}.parquet") for i in range(parts)]
+        segment = pd.concat(frames, ignore_index=True)
+        if key != UNDATED_SEGMENT:
+            # Overlapping readings are replaced by the most recently uploaded file
+            segment = segment.drop_duplicates("Time_stamp", keep="last")
+            segment = segment.sort_values("Time_stamp", kind="stable", ignore_index=True)
+        segment.to_parquet(f"{segment_path}.tmp", index=False, row_group_size=SEGMENT_ROW_GROUP)
+        os.replace(f"{segment_path}.tmp", segment_path)
+        meta["segments"][key] = {
+            "rows": len(segment),
+            "min": None if key == UNDATED_SEGMENT else str(segment["Time_stamp"].iloc[0]),
+            "max": None if key == UNDATED_SEGMENT else str(segment["Time_stamp"].iloc[-1]),
+            "stats": _segment_stats(segment),
+        }
+
+
+def ensure_cache(project_name, progress=None):
+    with _cache_lock(project_name):
+        meta, pending, refreshed = _ingest_plan(project_name)
+        if meta is None:
+            # First ingest, schema change or a replaced file: every source is merged again from scratch
+            _, segments_dir, meta_path = _cache_paths(project_name)
+            shutil.rmtree(segments_dir, ignore_errors=True)
+            for legacy_file in LEGACY_CACHE_FILES:
+                if os.path.exists(f"{project_name}/{CACHE_DIR}/{legacy_file}"):
+                    os.remove(f"{project_name}/{CACHE_DIR}/{legacy_file}")
+            meta = {"schema": SCHEMA_VERSION, "sources": [], "segments": {}}
+        elif refreshed:
+            # Stats of re-saved but unchanged sources, refreshed by _source_unchanged; an unchanged cache is
+            # only read
+            _write_meta(_cache_paths(project_name)[2], meta)
+
+        # Only the new files are parsed, and only the months they cover are rewritten
+        done_rows = 0
+        for source_path in pending:
+            offset = done_rows
+            try:
+                done_rows += _append_source(project_name, meta, source_path,
+                                            None if progress is None else lambda rows: progress(offset + rows))
+            except Exception as e:
+                raise SourceError(source_path, e) from e
+
+        _, segments_dir, meta_path = _cache_paths(project_name)
+        unprofiled = [key for key, segment in meta["segments"].items() if "stats" not in segment]
+        for key in unprofiled:
+            # Segments written before the catalog are profiled once from the segment, the sources are not parsed again
+            meta["segments"][key]["stats"] = _segment_stats(pd.read_parquet(_segment_path(segments_dir, key)))
+        if unprofiled:
+            _write_meta(meta_path, meta)
+        if pending or unprofiled or not os.path.exists(_catalog_path(project_name)):
+            _write_meta(_catalog_path(project_name), _build_catalog(meta))
+        return meta
+
+
+def _json_value(value):
+    if isinstance(value, pd.Timestamp):
+        return str(value)
+    return value.item() if hasattr(value, "item") else value
+
+
+def _segment_stats(segment):
+    # dtype, null count and min/max of every column plus the distinct deselect values, combined by _build_catalog
+    columns = {}
+    for column in segment.columns:
+        values = segment[column]
+        stats = {"dtype": str(values.dtype), "nulls": int(values.isna().sum())}
+        if (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)) and stats["nulls"] < len(values):
+            stats["min"], stats["max"] = _json_value(values.min()), _json_value(values.max())
+        columns[column] = stats
+    values = {column: sorted(int(value) for value in segment[column].dropna().unique()) for column in ("Hour", "day", "date")}
+    for column in ("month", "week_day"):
+        counts = segment[column].value_counts(sort=False)
+        values[column] = [value for value, count in counts.items() if count]
+    return {"columns": columns, "values": values}
+
+
+def _combine_values(values_list):
+    # Union in the order build_filter_codes gives its options: numbers sorted, names in calendar order
+    combined = {column: sorted(set().union(*(values[column] for values in values_list))) for column in ("Hour", "day", "date")}
+    for column, order in (("month", MONTHS), ("week_day", WEEK_DAYS)):
+        present = set().union(*(values[column] for values in values_list))
+        combined[column] = [value for value in order if value in present]
+    return combined
+
+
+def _build_catalog(meta):
+    keys = _segment_keys(meta)
+    rows = sum(meta["segments"][key]["rows"] for key in keys)
+    columns, stats = [], {}
+    for key in keys:
+        for column, segment_stats in meta["segments"][key]["stats"]["columns"].items():
+            if column not in stats:
+                columns.append(column)
+                # Rows of segments without the column are null once concatenated
+                stats[column] = {"dtype": segment_stats["dtype"], "nulls": rows}
+            total = stats[column]
+            total["nulls"] += segment_stats["nulls"] - meta["segments"][key]["rows"]
+            if "min" in segment_stats:
+                total["min"] = min(total.get("min", segment_stats["min"]), segment_stats["min"])
+                total["max"] = max(total.get("max", segment_stats["max"]), segment_stats["max"])
+    dated = [key for key in keys if key != UNDATED_SEGMENT]
+    return {
+        "schema": SCHEMA_VERSION,
+        "rows": rows,
+        "columns": columns,
+        "dtypes": {column: stats[column].pop("dtype") for column in columns},
+        "time_min": meta["segments"][dated[0]]["min"] if dated else None,
+        "time_max": meta["segments"][dated[-1]]["max"] if dated else None,
+        "stats": stats,
+        "values": _combine_values([meta["segments"][key]["stats"]["values"] for key in keys]),
+        # Per month, so the options of an analysis period come from its months only
+        "segments": {key: {"min": meta["segments"][key]["min"], "max": meta["segments"][key]["max"],
+                           "values": meta["segments"][key]["stats"]["values"]} for key in keys},
+    }
+
+
+def project_catalog(project_name):
+    # Written by the ingest, reading it opens no data file; a cache from before the catalog gets one here
+    catalog = _read_meta(_catalog_path(project_name))
+    if catalog is None or catalog.get("schema") != SCHEMA_VERSION:
+        ensure_cache(project_name)
+        catalog = _read_meta(_catalog_path(project_name))
+    return catalog
+
+
+def filter_options(catalog, start=None, end=None):
+    # Deselect widget options from the catalog, in the order and types of build_filter_codes
+    if start is None and end is None:
+        values = catalog["values"]
+    else:
+        values = _combine_values([catalog["segments"][key]["values"] for key in _segment_keys(catalog, start, end)])
+        first = -np.inf if start is None else int(date_ordinals([pd.Timestamp(start)])[0])
+        last = np.inf if end is None else int(date_ordinals([pd.Timestamp(end)])[0])
+        values = dict(values, date=[day for day in values["date"] if first <= day < last])
+    options = {column: list(values[column]) for column in ("Hour", "day", "month", "week_day")}
+    options["date"] = [np.datetime64(day, "D").astype(object) for day in values["date"]]
+    return options
+
+
+def _segment_keys(meta, start=None, end=None, exclude_months=()):
+    # Month segments whose min/max timestamps overlap [start, end), undated rows only for an open range
+    keys = []
+    for key in sorted(meta["segments"]):
+        segment = meta["segments"][key]
+        if key == UNDATED_SEGMENT:
+            if start is None and end is None:
+                keys.append(key)
+            continue
+        if MONTHS[int(key[5:7]) - 1] in exclude_months:
+            continue
+        if start is not None and pd.Timestamp(segment["max"]) < pd.Timestamp(start):
+            continue
+        if end is not None and pd.Timestamp(segment["min"]) >= pd.Timestamp(end):
+            continue
+        keys.append(key)
+    # Undated rows last, as before
+    return sorted(keys, key=lambda key: key == UNDATED_SEGMENT)
+
+
+def time_range(catalog):
+    # First and last reading, without reading any data
+    if catalog["time_min"] is None:
+        return None, None
+    return pd.Timestamp(catalog["time_min"]), pd.Timestamp(catalog["time_max"])
+
+
+def load_frame(project_name, start=None, end=None, exclude_months=(), exclude_dates=()):
+    # Pruned in two steps: whole month segments from the manifest, then row groups from their
+    # Parquet min/max statistics, so excluded periods are never read or preprocessed
+    meta = ensure_cache(project_name)
+    _, segments_dir, _ = _cache_paths(project_name)
+    keys = _segment_keys(meta, start, end, exclude_months)
+
+    filters = []
+    if start is not None:
+        filters.append(("Time_stamp", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("Time_stamp", "<", pd.Timestamp(end)))
+    excluded = sorted({int(day) for day in date_ordinals(pd.to_datetime(list(exclude_dates))).dropna()})
+    if excluded:
+        # The kept days as ranges between the excluded ones, a "not in" filter cannot skip row groups by
+        # their date min/max, these ranges can
+        ranges = [[("date", "<", excluded[0])]]
+        ranges += [[("date", ">", low), ("date", "<", high)] for low, high in zip(excluded, excluded[1:]) if high - low > 1]
+        ranges.append([("date", ">", excluded[-1])])
+        filters = [filters + kept for kept in ranges]
+
+    with _cache_lock(project_name):
+        # Undated rows have no date to exclude them by, they are kept like the in-memory filters do
+        frames = [
+            pd.read_parquet(_segment_path(segments_dir, key), filters=filters if key != UNDATED_SEGMENT and filters else None)
+            for key in keys
+        ]
+        if not frames:
+            # Nothing in range, an empty frame with the project's columns
+            frames = [pd.read_parquet(_segment_path(segments_dir, min(meta["segments"]))).iloc[:0]]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,148 @@
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from data_store import load_frame, project_files
+from processing import add_system_sums, build_filter_codes, hourly_buckets
+
+# Upper bound for the loaded frames held by this server process
+DEFAULT_BUDGET_BYTES = int(os.environ.get("DATASET_CACHE_BYTES", 2 * 1024 ** 3))
+
+
+def dataset_version(project_name):
+    # Rewriting the project JSON or a data file, or adding one, changes the version, the JSON comes first
+    version = []
+    json_path, source_paths = project_files(project_name)
+    for path in [json_path] + source_paths:
+        stat = os.stat(path)
+        version.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(version)
+
+
+class DatasetCache:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per project, so concurrent first loads of a project run the preprocessing once
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.reassignments = 0
+        self.evictions = 0
+
+    def _evict(self, keep):
+        # Least recently used first, the entry just loaded is always kept
+        while self.size_bytes() > self.budget_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                continue
+            del self._entries[key]
+            self.evictions += 1
+
+    def size_bytes(self):
+        return sum(entry[5] for entry in self._entries.values())
+
+    def _lookup(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            return None
+
+    def get(self, project_name, start=None, end=None):
+        # Every session looking at the same period of a project shares one entry
+        key = (project_name, start, end)
+        version = dataset_version(project_name)
+        entry = self._lookup(key, version)
+        if entry is not None:
+            return self._view(entry)
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            # Another session may have finished the same load while this one waited
+            entry = self._lookup(key, version)
+            if entry is None:
+                with self._lock:
+                    stale = self._entries.get(key)
+                if stale is not None and stale[0][1:] == version[1:]:
+                    # Only the project JSON changed (e.g. circuits reassigned), the loaded rows are kept
+                    with self._lock:
+                        self.reassignments += 1
+                    entry = self._reassign(stale, project_name, version)
+                else:
+                    with self._lock:
+                        self.misses += 1
+                    entry = self._load(project_name, version, start, end)
+                with self._lock:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    self._evict(keep=key)
+        return self._view(entry)
+
+    @staticmethod
+    def _read_config(project_name):
+        json_path, _ = project_files(project_name)
+        with open(json_path, "r") as json_file_data:
+            return json.load(json_file_data)
+
+    @staticmethod
+    def _entry(version, data, df, buckets, filter_codes):
+        size = int(df.memory_usage(deep=True).sum()) + sum(codes.nbytes for codes, options in filter_codes.values())
+        size += sum(array.nbytes for array in buckets)
+        return (version, data, df, buckets, filter_codes, size)
+
+    def _load(self, project_name, version, start, end):
+        data = self._read_config(project_name)
+        # Only the period's segments are read, then preprocessed once per server process, sessions only ever read it
+        df = load_frame(project_name, start, end)
+        buckets = hourly_buckets(df["Time_stamp"])
+        df = add_system_sums(df, data, buckets)
+        filter_codes = build_filter_codes(df)
+        for codes, options in filter_codes.values():
+            codes.flags.writeable = False
+        return self._entry(version, data, df, buckets, filter_codes)
+
+    def _reassign(self, entry, project_name, version):
+        # System sums recomputed from the cached circuit readings and hourly buckets, no segment is read again
+        _, _, df, buckets, filter_codes, _ = entry
+        data = self._read_config(project_name)
+        return self._entry(version, data, add_system_sums(df, data, buckets), buckets, filter_codes)
+
+    def invalidate(self, project_name=None):
+        with self._lock:
+            if project_name is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == project_name]:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "projects": len({key[0] for key in self._entries}),
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes(),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reassignments": self.reassignments,
+                "evictions": self.evictions,
+            }
+
+    @staticmethod
+    def _view(entry):
+        version, data, df, buckets, filter_codes, size = entry
+        # Shallow copy shares the column buffers, copy-on-write (always on since pandas 3.0, pinned in requirements.txt)
+        # keeps the cached frame intact
+        return copy.deepcopy(data), df.copy(deep=False), filter_codes
+
+
+# One cache per server process, shared by every session
+dataset_cache = DatasetCache()
@@ -0,0 +1,146 @@
+import datetime
+import shutil
+
+import pandas as pd
+
+TIME_STAMP_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+# Rows held in memory at once while converting an upload
+CHUNK_ROWS = 50000
+PREVIEW_ROWS = 100
+
+REQUIRED_COLUMNS = ["TIME_STAMP", "TEMP_OUT", "TEMP_GATE", "HUMID_OUT", "HUMID_GATE"]
+NUMERIC_PREFIXES = ("C_", "TEMP_", "HUMID_")
+
+SUPPORTED_EXTENSIONS = (".xlsx", ".csv")
+
+
+def validate_header(columns):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    if not any(str(column).startswith("C_") for column in columns):
+        raise ValueError("No circuit columns found, circuit headers must start with 'C_'")
+    duplicated = sorted({column for column in columns if columns.count(column) > 1})
+    if duplicated:
+        raise ValueError(f"Duplicated columns: {', '.join(duplicated)}")
+
+
+def _format_time_stamp(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_STAMP_FORMAT)
+    return None if value is None else str(value)
+
+
+def _typed_columns(chunk):
+    for column in chunk.columns:
+        if column == "TIME_STAMP":
+            chunk[column] = chunk[column].map(_format_time_stamp).astype("str")
+        elif column.startswith(NUMERIC_PREFIXES):
+            # Placeholders such as "No CT" become NaN, meter readings fit in float32
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype("float32")
+        else:
+            chunk[column] = chunk[column].astype("str")
+    return chunk
+
+
+def _typed_chunk(columns, rows):
+    return _typed_columns(pd.DataFrame.from_records(rows, columns=columns))
+
+
+def _excel_rows(source):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("The uploaded file is empty")
+        # Trailing blank header cells are formatting, not columns
+        header = list(header)
+        while header and header[-1] is None:
+            header.pop()
+        # Blank cells between columns keep their position, named as pd.read_excel does
+        columns = [f"Unnamed: {i}" if column is None else str(column) for i, column in enumerate(header)]
+        yield columns
+        for row in rows:
+            row = row[:len(columns)]
+            if all(value is None for value in row):
+                continue
+            yield row
+    finally:
+        workbook.close()
+
+
+def iter_chunks(source, file_name, chunk_rows=CHUNK_ROWS):
+    if file_name.lower().endswith(".csv"):
+        # Readings are parsed by the C parser, only the other columns are read as text
+        header = pd.read_csv(source, nrows=0).columns
+        if hasattr(source, "seek"):
+            source.seek(0)
+        text_columns = {column: str for column in header if not str(column).startswith(NUMERIC_PREFIXES)}
+        # Closed explicitly, a collected reader would also close an uploaded file that is still to be saved
+        with pd.read_csv(source, chunksize=chunk_rows, dtype=text_columns, keep_default_na=False, na_values=[""],
+                         low_memory=False) as reader:
+            for i, chunk in enumerate(reader):
+                chunk.columns = [str(column) for column in chunk.columns]
+                if i == 0:
+                    validate_header(list(chunk.columns))
+                # Converted column by column, rebuilding the chunk from row tuples costs more than the parse
+                yield _typed_columns(chunk)
+        return
+
+    rows = _excel_rows(source)
+    columns = next(rows)
+    validate_header(columns)
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk_rows:
+            yield _typed_chunk(columns, buffer)
+            buffer = []
+    if buffer:
+        yield _typed_chunk(columns, buffer)
+
+
+def estimate_rows(source, file_name, chunk_size=1024 * 1024):
+    # Data rows for progress reporting, exact for CSV, from the sheet dimension for Excel (None if missing)
+    if file_name.lower().endswith(".csv"):
+        lines = 0
+        last = b"\n"
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+        return max(lines - (last == b"\n"), 0)
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True)
+    try:
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+    return None if max_row is None else max(max_row - 1, 0)
+
+
+def read_preview(source, file_name, rows=PREVIEW_ROWS):
+    chunks = iter_chunks(source, file_name, chunk_rows=rows)
+    try:
+        preview = next(chunks)
+    except StopIteration:
+        raise ValueError("The uploaded file has no data rows")
+    finally:
+        chunks.close()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return preview
+
+
+def save_upload(uploaded_file, path, chunk_size=1024 * 1024):
+    uploaded_file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(uploaded_file, f, chunk_size)
+    uploaded_file.seek(0)
+
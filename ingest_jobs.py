@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from project_registry import ACTIVE, DONE, FAILED, JOB_LEASE_SECONDS, RUNNING, ProjectRegistry
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+# A chunk is converted every few hundred ms on large files, progress is written at most this often
+PROGRESS_INTERVAL = 0.5
+# Share of the progress bar for the conversion, the rest is the column check after it
+CONVERT_SHARE = 0.95
+# Leases are renewed several times per lease, a slow registry write does not let them expire
+HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 4
+
+# Owner of the jobs this server process runs, a PID can come back after a restart, this token cannot
+PROCESS_TOKEN = uuid.uuid4().hex
+
+# One pool per server process, shared by every session
+_executor = None
+_lock = threading.Lock()
+# Summary refresh per project queued by this process, a project is never queued twice at once
+_summary_futures = {}
+
+
+def _resume_orphaned_jobs(registry):
+    # Jobs of a server process that stopped renewing their lease, restarted or crashed, run again here
+    for job_id, project_name in registry.claim_orphaned_jobs(PROCESS_TOKEN):
+        _executor.submit(run_ingest, registry.path, job_id, project_name)
+
+
+def _heartbeat(registry):
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        try:
+            registry.renew_jobs(PROCESS_TOKEN)
+            _resume_orphaned_jobs(registry)
+        except Exception:
+            # A busy or briefly unavailable registry, the next beat is still well within the lease
+            continue
+
+
+def _get_executor(registry):
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Forking the threaded Streamlit server is unsafe, workers start from a fresh interpreter
+            _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            _resume_orphaned_jobs(registry)
+            threading.Thread(target=_heartbeat, args=(registry,), name="ingest-heartbeat", daemon=True).start()
+        return _executor
+
+
+def resume_jobs(registry):
+    _get_executor(registry)
+
+
+def submit_ingest(registry, project_name):
+    job_id = registry.create_job(project_name, PROCESS_TOKEN)
+    _get_executor(registry).submit(run_ingest, registry.path, job_id, project_name)
+    return job_id
+
+
+def submit_summary(registry, project_name):
+    # Portfolio summary recomputed in the pool after the project's data or systems changed
+    with _lock:
+        future = _summary_futures.get(project_name)
+        if future is not None and not future.done():
+            return False
+    future = _get_executor(registry).submit(run_summary, registry.path, project_name)
+    with _lock:
+        _summary_futures[project_name] = future
+    return True
+
+
+def run_summary(registry_path, project_name):
+    from portfolio_summary import refresh_summary
+
+    registry = ProjectRegistry(registry_path)
+    project = registry.get(project_name)
+    # Projects still converting are summarized at the end of their ingest
+    if project is None or project["status"] != ACTIVE:
+        return None
+    return refresh_summary(registry, project_name)
+
+
+def run_ingest(registry_path, job_id, project_name):
+    # Runs in a worker process, everything it reports goes through the registry. The parsing stack is
+    # imported here, so submitting a job from the landing page does not load pandas
+    from data_store import SourceError, ensure_cache, ingested_sources, pending_sources, project_catalog
+    from ingest import estimate_rows
+
+    registry = ProjectRegistry(registry_path)
+    folder = registry.folder(project_name)
+    rejected = []
+    has_data = False
+    try:
+        # New files for a project that already has data: a bad one is dropped instead of failing the project
+        pending = pending_sources(folder)
+        has_data = bool(ingested_sources(folder))
+        appended = {os.path.basename(source) for source in pending} if has_data else set()
+        registry.update_job(job_id, status=RUNNING, message="Counting rows")
+        # Only files not ingested yet are parsed, an appended month costs only its own rows
+        estimates = [estimate_rows(source, os.path.basename(source)) for source in pending]
+        total_rows = None if None in estimates else sum(estimates)
+
+        last_update = 0.0
+        def progress(rows):
+            nonlocal last_update
+            now = time.perf_counter()
+            if now - last_update < PROGRESS_INTERVAL:
+                return
+            last_update = now
+            fraction = min(rows / total_rows, 1.0) * CONVERT_SHARE if total_rows else 0.0
+            message = f"Converted {rows:,} of {total_rows:,} rows" if total_rows else f"Converted {rows:,} rows"
+            registry.update_job(job_id, progress=fraction, message=message)
+
+        registry.update_job(job_id, message="Validating and converting")
+        # Parses, validates the header, adds the calendar columns and merges the rows into month segments,
+        # then writes the project catalog
+        while True:
+            try:
+                ensure_cache(folder, progress)
+                break
+            except SourceError as e:
+                # Files ingested before are never removed, even when a rebuild fails on them
+                source_file = os.path.basename(e.source_path)
+                if source_file not in appended:
+                    raise
+                # Removed from the folder, so it is no longer pending and the files after it are merged on the retry
+                appended.discard(source_file)
+                os.remove(e.source_path)
+                registry.drop_source(project_name, source_file, str(e))
+                rejected.append(str(e))
+        catalog = project_catalog(folder)
+
+        project = registry.get(project_name)
+        metadata = dict(project["metadata"]) if project else {}
+        metadata.update({"rows": catalog["rows"], "circuits": sum(column.startswith("C_") for column in catalog["columns"])})
+        registry.update(project_name, metadata=metadata)
+        if rejected:
+            # The error is the job's only, the project is active again with the data it had
+            registry.update_job(job_id, status=FAILED, progress=1.0, message="Appended data rejected", error="; ".join(rejected))
+        else:
+            registry.update_job(job_id, status=DONE, progress=1.0, message="Ready")
+        registry.finish_processing(project_name)
+    except Exception as e:
+        error = str(e) if isinstance(e, SourceError) else f"{type(e).__name__}: {e}"
+        registry.update_job(job_id, status=FAILED, message="Failed", error=error)
+        # Only a first upload fails the project; one with data stays listed, and collectable only once deleted,
+        # its next load retries the merge
+        registry.finish_processing(project_name, failed=not has_data)
+        return job_id
+    # A saved project's portfolio summary follows its new data at once
+    run_summary(registry_path, project_name)
+    return job_id
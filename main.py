@@ -1,14 +1,72 @@
 import streamlit as st
-import pandas as pd
 import os
 import json
-import subprocess
-from streamlit_extras.switch_page_button import switch_page
 import shutil
+import threading
+from ingest_jobs import resume_jobs, submit_ingest, submit_summary
+from profiling import begin_timing, debug_flags, show_debug_panel, stage
+from project_registry import ACTIVE, DONE, FAILED, PROCESSING, ProjectRegistry
+from startup import warm_up
+
+# pandas and the parsing modules are only imported once a file is uploaded or a dialog opens,
+# the landing page and the project list render without them
 
 
 st.set_page_config(layout="wide",initial_sidebar_state="collapsed")
 
+# Stage timings go to the log on every rerun, the panel is opt-in with ?debug=1
+debug, profile = debug_flags()
+begin_timing("main",debug,profile)
+
+# Projects, their files and status, shared safely by concurrent sessions
+registry = ProjectRegistry()
+resume_jobs(registry)
+
+
+def show_ingest_progress(job_id):
+    job = registry.get_job(job_id)
+    if job["status"] == DONE:
+        st.success("File saved successfully to the backend!")
+    elif job["status"] == FAILED:
+        st.error(f"Error processing file: {job['error']}")
+    else:
+        poll_ingest_job(job_id)
+
+
+@st.fragment(run_every=1)
+def poll_ingest_job(job_id):
+    # Only this fragment reruns while the worker converts the file, the rest of the form stays usable
+    job = registry.get_job(job_id)
+    if job["status"] in (DONE, FAILED):
+        st.rerun()
+    st.progress(job["progress"],text=job["message"])
+
+
+def unique_file_name(folder,file_name):
+    # Monthly exports often share a name, an appended file must never replace an ingested one
+    base,extension = os.path.splitext(file_name)
+    candidate,i = file_name,1
+    while os.path.exists(f"{folder}/{candidate}"):
+        i += 1
+        candidate = f"{base} ({i}){extension}"
+    return candidate
+
+
+def saved_projects(status):
+    # Uploads whose systems were not saved yet are only shown to their uploader in tab 1
+    return [project["name"] for project in registry.projects(status) if project["config_file"] is not None]
+
+
+@st.fragment(run_every=2)
+def show_processing_projects(names):
+    # Reruns the whole page once a project is ready or failed, so it moves to its list
+    if saved_projects(PROCESSING) != names:
+        st.rerun()
+    for name in names:
+        job = registry.latest_job(name)
+        with st.expander(f"{name} (processing)"):
+            st.progress(job["progress"] if job else 0.0,text=job["message"] if job else "Queued")
+
 
 tab_1,tab_2 = st.tabs(["Upload New File","Analysis"])
 
@@ -26,13 +84,17 @@ with tab_1:
         st.text("4. Humidity Column should be HUMID_OUT and HUMID_GATE")
         acknowledge_bt = st.form_submit_button("Acknowledge")
 
-    # Upload a single Excel file
-    uploaded_file = st.file_uploader("Choose an Excel file", type=["xlsx"])
+    # Upload a single Excel or CSV file
+    uploaded_file = st.file_uploader("Choose an Excel file", type=["xlsx","csv"])
 
     if uploaded_file is not None:
-        # To read the uploaded excel file
+        from ingest import read_preview, save_upload
+
+        # Only the first rows are parsed here, the full file is streamed on save
         try:
-            df = pd.read_excel(uploaded_file)
+            with stage("upload preview") as timing:
+                df = read_preview(uploaded_file,uploaded_file.name)
+                timing.rows = len(df)
 
             # Display the data in the file
             st.write("Data Loaded successfully! Here's a preview:")
@@ -41,16 +103,38 @@ with tab_1:
             project_name = st.text_input("Enter Analysis Name:",value = None)
             
             # Save the file to the backend
-            if project_name is not None:
-                try:
-                    os.mkdir(f'{project_name}')
-                except Exception as e:
-                    pass
-                
-                with open(f"{project_name}/{uploaded_file.name}", "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+            if project_name:
+                # Saved and queued once per upload, later reruns of the form only poll the job
+                job_key = f"ingest_job_{project_name}_{uploaded_file.file_id}"
+                if job_key not in st.session_state:
+                    # One plain folder name under the registry's folder, anything else is refused before a file is touched
+                    folder = registry.folder(project_name)
+                    existing = registry.get(project_name)
+                    if existing is not None and existing["status"] in (ACTIVE,PROCESSING):
+                        raise ValueError(f"An analysis named '{project_name}' already exists, append new data to it from the Analysis tab")
+                    if existing is None and os.path.lexists(folder):
+                        # Not a project the registry owns, it is never replaced
+                        raise ValueError(f"A folder named '{project_name}' already exists, choose another analysis name")
+                    # Listed as processing until the worker has converted it, unsaved drafts are collected after a day.
+                    # Registered before the folder is touched: a garbage collection still pending from deleting this
+                    # name only removes folders whose row is still deleted, so it cannot remove the new upload
+                    registry.register(project_name,uploaded_file.name,metadata={"size": uploaded_file.size})
+                    try:
+                        # Leftovers of a deleted, failed or never saved project with this name start over
+                        if existing is not None:
+                            shutil.rmtree(folder,ignore_errors=True)
+                        os.makedirs(folder,exist_ok=True)
+                        
+                        with stage("save upload"):
+                            save_upload(uploaded_file,os.path.join(folder,uploaded_file.name))
+                    except Exception:
+                        # No job will pick it up, collected like any failed upload
+                        registry.update(project_name,status=FAILED)
+                        raise
+                    # Parsed, validated and converted to Parquet by a background worker
+                    st.session_state[job_key] = submit_ingest(registry,project_name)
 
-                st.success("File saved successfully to the backend!")
+                show_ingest_progress(st.session_state[job_key])
                 
                 total_systems = st.number_input("Enter No of Systems",min_value=0,max_value=100,value=None)
 
@@ -89,18 +173,12 @@ with tab_1:
                     if save_to_json == 'Save':
                         file_name = str(uploaded_file.name)
                         analysis_system_details_json = json.dumps(analysis_system_details)
-                        file_name = file_name.replace('xlsx','json')
+                        file_name = os.path.splitext(file_name)[0] + '.json'
                         with open(f"{project_name}/{file_name}", "w") as file:
                             file.write(analysis_system_details_json)
+                        registry.activate(project_name,file_name)
+                        submit_summary(registry,project_name)
                         st.success("Successfully Updated! Kindly Check with Analysis Tab for the Saved Data")
-                        with open('folders.json','r') as folders_json:
-                            data = json.load(folders_json)
-                            
-                        with open('folders.json','w') as folders_json:
-                            data[project_name] = [uploaded_file.name,file_name]
-                            st.write(data)
-                            json_data = json.dumps(data)
-                            folders_json.write(json_data)
 
         except Exception as e:
             st.error(f"Error uploading file: {e}")
@@ -110,18 +188,15 @@ with tab_1:
 
 @st.dialog("Edit System Data")
 def edit_system_data(project_name):
+    from data_store import project_catalog
     
-    json_file = [file for file in os.listdir(project_name) if file.endswith('.json')]
-    with open(f"{project_name}/{json_file[0]}", "r") as json_file_data:
+    json_file_name = registry.get(project_name)["config_file"]
+    with open(f"{project_name}/{json_file_name}", "r") as json_file_data:
         data = json.load(json_file_data)
-        json_file_data.close()
-        
-    json_file_name = json_file[0]
         
-    excel_file = [file for file in os.listdir(project_name) if file.endswith('.xlsx')]
-    df = pd.read_excel(f"{project_name}/{excel_file[0]}")
-    
-    columns_list = list(df.columns)
+    # Column names from the catalog written at ingest, no data file is opened
+    with stage("load catalog"):
+        columns_list = project_catalog(project_name)["columns"]
     
    
     filtered_column = [item for item in columns_list if item.startswith("C_")]
@@ -156,28 +231,33 @@ def edit_system_data(project_name):
         with open(f"{project_name}/{json_file_name}", "w") as file:
             file.write(analysis_system_details_json)
             file.close()
+        submit_summary(registry,project_name)
         st.success("Successfully Updated! Changes Made")
         
 
 
 with tab_2:
-    with open("folders.json",'r') as folder_json_file:
-        folders_json = json.load(folder_json_file)
-    
-    folders = list(folders_json.keys())
+    # Indexed read of the saved projects, folders are never touched while rendering
+    folders = registry.project_names()
     
-    # st.write(folders)
-        
-    folders_actual_list = [name for name in os.listdir('.') if os.path.isdir(name)]
-    
-    folders_actual_list = [item for item in folders_actual_list if item != "pages"]
-    
-    folders_deleted = [item for item in folders_actual_list if item not in folders]
+    # Savings of every project side by side, from the precomputed summaries
+    if st.button("Portfolio"):
+        from streamlit_extras.switch_page_button import switch_page
+
+        switch_page("portfolio")
     
-    # st.write(folders_deleted)
+    processing = saved_projects(PROCESSING)
+    if processing:
+        show_processing_projects(processing)
     
-    for deleted_folder in folders_deleted:
-        shutil.rmtree(deleted_folder)
+    for folder in saved_projects(FAILED):
+        with st.expander(f"{folder} (failed)"):
+            job = registry.latest_job(folder)
+            st.error(job["error"] if job else "Processing failed")
+            if st.button("Delete Analysis",key=f"delete_{folder}"):
+                registry.delete(folder)
+                threading.Thread(target=registry.collect_garbage,daemon=True).start()
+                st.rerun()
     
     for folder in folders:
         with st.expander(f"{folder}"):
@@ -187,22 +267,38 @@ with tab_2:
             
                 
             if analysis_button:
+                from streamlit_extras.switch_page_button import switch_page
+
                 st.session_state.project_name = folder
                 switch_page("analysis")
                 
             if delete_button:
-                with open('folders.json','w') as folder_json_file:
-                    del folders_json[folder]
-                    st.write(folders_json)
-                    json_data = json.dumps(folders_json)
-                    folder_json_file.write(json_data)
+                # Hidden at once, the folder is removed by the garbage collection in the background
+                registry.delete(folder)
+                threading.Thread(target=registry.collect_garbage,daemon=True).start()
                 st.rerun()
-                    
-                
-                
-                
-    
-      
-    
-                
-        
\ No newline at end of file
+            
+            # An appended file that could not be merged was dropped, the project kept the data it had
+            job = registry.latest_job(folder)
+            if job is not None and job["status"] == FAILED:
+                st.warning(f"Appended data was not merged: {job['error']}")
+            
+            # A new month of data is merged into the project, only its own rows are parsed
+            appended_file = c4.file_uploader("Append data file",type=["xlsx","csv"],key=f"append_file_{folder}")
+            if appended_file is not None and c4.button("Append Data",key=f"append_{folder}"):
+                from ingest import read_preview, save_upload
+
+                try:
+                    read_preview(appended_file,appended_file.name)
+                    file_name = unique_file_name(folder,appended_file.name)
+                    save_upload(appended_file,f"{folder}/{file_name}")
+                    registry.add_source(folder,file_name)
+                    submit_ingest(registry,folder)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error appending file: {e}")
+
+show_debug_panel()
+
+# Analytics modules load in the background once the page is out, the first Check Analysis does not wait for them
+warm_up()
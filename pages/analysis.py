@@ -1,47 +1,54 @@
 import streamlit as st
-import json
 import pandas as pd
-import os
-from matplotlib.colors import LinearSegmentedColormap
 import altair as alt
-import datetime
-import numpy as np
-
-@st.cache_data
-def load_data(project_name):
-    json_file = [file for file in os.listdir(project_name) if file.endswith('.json')]
-    with open(f"{project_name}/{json_file[0]}", "r") as json_file_data:
-        data = json.load(json_file_data)
-        
-    excel_file = [file for file in os.listdir(project_name) if file.endswith('.xlsx')]
-    df = pd.read_excel(f"{project_name}/{excel_file[0]}")
-    return data, df
+from data_store import filter_options, ordinal_dates, project_catalog, time_range
+from dataset_cache import dataset_cache, dataset_version
+from chart_data import chart_spec, downsample
+from data_grid import column_ranges, grid_html
+from compute_graph import node, show_report, start_rerun
+from profiling import begin_timing, debug_flags, show_debug_panel, stage
+from savings import savings_estimate
+from baseline import LINEAR, MAX_CV_RMSE, MAX_NMBE, MODELS, baseline_savings
+from processing import add_m_round_columns, deselect_mask, filtered_view, build_system_cubes, cube_average, cube_pivot
+
+def load_data(project_name,start=None,end=None):
+    # Preprocessed frame and filter codes shared by every session, served as a zero-copy view
+    return dataset_cache.get(project_name,start,end)
 
 # Define project_name
 project_name = st.session_state.get("project_name")
-pd.set_option("styler.render.max_elements", 455838)
+
+# Stage timings go to the log on every rerun, the panel is opt-in with ?debug=1
+debug, profile = debug_flags()
+begin_timing("analysis",debug,profile)
 
 st.title(f":green[{project_name} Analysis]")
 
-# Load data and cache it
-data, df = load_data(project_name)
+# Time range and deselect options come from the catalog written at ingest, no data is read for them
+catalog = project_catalog(project_name)
 
-# Preprocess the data
-df['Time_stamp'] = pd.to_datetime(df['TIME_STAMP'], format="%m/%d/%Y %H:%M:%S", errors='coerce')
-df["Hour"] = df["Time_stamp"].dt.hour
-df["week_day"] = df["Time_stamp"].dt.day_name()
-df["date"] = df["Time_stamp"].dt.date
-df["day"] = df["Time_stamp"].dt.day
-df["month"] = df["Time_stamp"].dt.month_name()
+# Analysis period, pushed down to the loader so months outside it are never read or preprocessed
+first_reading, last_reading = time_range(catalog)
+period_start = period_end = None
+if first_reading is not None:
+    full_period = (first_reading.date(),last_reading.date())
+    period = st.date_input("Analysis Period",value=full_period,min_value=full_period[0],max_value=full_period[1])
+    # The full period keeps the shared unfiltered dataset, undated readings included
+    if len(period) == 2 and tuple(period) != full_period:
+        period_start, period_end = pd.Timestamp(period[0]), pd.Timestamp(period[1]) + pd.Timedelta(days=1)
 
-# Sum system columns and calculate averages
-for key, value in data.items():
-    if key.startswith("System"):
-        df[f"{key}_KW_SUM"] = df[value].sum(axis=1)
-        df[f"{key}_KW_SUM_Average"] = df.groupby(['Hour', 'date'])[f"{key}_KW_SUM"].transform('mean')
+# Load data and cache it
+with stage("load") as timing:
+    version = dataset_version(project_name)
+    data, df, filter_codes = load_data(project_name,period_start,period_end)
+    timing.rows = len(df)
 
-# Custom color map
-custom_cmap = LinearSegmentedColormap.from_list('custom_cmap', ['green','yellow', 'orange', 'red'])
+# Each stage below is memoized on its inputs, a widget change only recomputes its downstream nodes
+start_rerun()
+base_key = (project_name,version,period_start,period_end)
+
+# Gradient scale per column over the whole dataset, so colours are comparable between pages
+grid_ranges = node("grid_ranges",base_key,lambda: column_ranges(df.drop(columns=["date"])))
 
 c1,space,c2 = st.columns([1,0.20,1])
 # Pagination control
@@ -52,14 +59,13 @@ page_num = c2.number_input("Page number", min_value=1, max_value=(len(df) // pag
 start_idx = (page_num - 1) * page_size
 end_idx = start_idx + page_size
 
-# Paginate the DataFrame
+# Paginate the DataFrame, dates are stored as day numbers and only converted for the visible rows
 df_page = df.iloc[start_idx:end_idx]
+df_page = df_page.assign(date=ordinal_dates(df_page["date"]))
 
-# Apply gradient only to the visible page of data
-styled_df = df_page.style.background_gradient(cmap=custom_cmap)
-
-# Display the paginated DataFrame
-st.write(styled_df)
+# Display the paginated DataFrame with the gradient colours of the visible page only
+with stage("data grid",rows=len(df_page)):
+    st.markdown(grid_html(df_page,grid_ranges),unsafe_allow_html=True)
 
 columns_list = data.keys()
 
@@ -67,429 +73,265 @@ columns_list = [i for i in columns_list if i.startswith('System')]
 
 tabs = st.tabs(columns_list)
 
+# Deselect widget options of the period, shared by every system tab
+options = filter_options(catalog,period_start,period_end)
 
 
-def show_input_values(system_number,df_raw,json_data):
+
+def show_input_values(system_number,df_raw,json_data,filter_codes,options,base_key):
     c1,c2,c3,c4,c5 = st.columns([1,1,1,1,1])
     
     # st.write(df_raw)
 
     with c1:
-        ds_hour_list = st.multiselect(f"Deselect Hour of the Day for System {system_number}",options=list(set(df_raw["Hour"])))
+        ds_hour_list = st.multiselect(f"Deselect Hour of the Day for System {system_number}",options=options["Hour"])
         m_round = st.number_input(
             f":green[Enter mRound Value for ∆T Filtered Data {system_number}]", value=0.5, placeholder="Type a number...",step=0.5
         )
         
     with c2:
-        ds_day_list = st.multiselect(f"Deselect Specific Days of Month for System {system_number}",options=list(set(df_raw["day"])))
+        ds_day_list = st.multiselect(f"Deselect Specific Days of Month for System {system_number}",options=options["day"])
         instl_dt = st.date_input(f":green[Installation Date System {system_number}]",value=json_data[f"Installation Date System {system_number}"])
         
     with c3:
-        ds_month_list = st.multiselect(f"Deselect Months for System {system_number}",options=list(set(df_raw["month"])))
+        ds_month_list = st.multiselect(f"Deselect Months for System {system_number}",options=options["month"])
         
     with c4:
-        ds_weekday_list = st.multiselect(f"Deselect Weekdays for System {system_number}",options=list(set(df_raw["week_day"])))
+        ds_weekday_list = st.multiselect(f"Deselect Weekdays for System {system_number}",options=options["week_day"])
         
     with c5:
-        ds_dates_list = st.multiselect(f"Deselect Specific Dates for System {system_number}",options=list(set(df_raw["date"])))
+        ds_dates_list = st.multiselect(f"Deselect Specific Dates for System {system_number}",options=options["date"])
         
-    df_filtered = df_raw.copy()
+    deselected = {
+        "Hour": ds_hour_list,
+        "day": ds_day_list,
+        "month": ds_month_list,
+        "week_day": ds_weekday_list,
+        "date": ds_dates_list,
+    }
+    filter_key = (base_key,system_number,tuple((column,tuple(values)) for column,values in deselected.items()))
     
-    # Filter out the deselected hours
-    if ds_hour_list:
-        df_filtered = df_filtered[~df_filtered["Hour"].isin(ds_hour_list)]
-
-    # Filter out the deselected days of the month
-    if ds_day_list:
-        df_filtered = df_filtered[~df_filtered["day"].isin(ds_day_list)]
+    # Filter out the deselected hours, days of the month, months, weekdays and specific dates
+    # Only the row mask is kept in the session, the rows themselves stay in the shared dataset
+    row_mask = node(f"System {system_number}/filter",filter_key,lambda: deselect_mask(filter_codes,deselected))
+    rows = len(df_raw) if row_mask is None else int(row_mask.sum())
+    
+    binning_key = (filter_key,m_round,instl_dt)
 
-    # Filter out the deselected years
-    if ds_month_list:
-        df_filtered = df_filtered[~df_filtered["month"].isin(ds_month_list)]
+    st.write(":blue[NO. Of Rows : ]",f":red[{str(rows)}]")
+    st.write(":blue[Total NO. Of Rows Removed : ]",f":red[{str(len(df_raw) - rows)}]")
+    
+    return row_mask, m_round, instl_dt, binning_key
 
-    # Filter out the deselected weekdays
-    if ds_weekday_list:
-        df_filtered = df_filtered[~df_filtered["week_day"].isin(ds_weekday_list)]
 
-    # Filter out the deselected specific dates
-    if ds_dates_list:
-        df_filtered = df_filtered[~df_filtered["date"].isin(ds_dates_list)]
-        
-        
-    df_filtered["∆T"] = df_filtered["TEMP_OUT"] - df_filtered["TEMP_GATE"]
-    df_filtered["∆T M_ROUND"] = df_filtered["∆T"].apply(
-                    lambda x: m_round * round(x/m_round) if not np.isnan(x) else np.nan
-                )
+def system_cubes(df_raw,system_id,row_mask,m_round,instl_dt):
+    # Bin temperatures to m_round steps, label rows Pre/Post installation and summarize, only the cubes are memoized
+    df_filtered = filtered_view(df_raw,row_mask,["Time_stamp","Hour","date","TEMP_OUT","TEMP_GATE",f"{system_id}_KW_SUM_Average"])
+    df_filtered = add_m_round_columns(df_filtered,m_round,instl_dt)
+    return build_system_cubes(df_filtered,system_id)
     
-    df_filtered["TEMP_OUT M_ROUND"] = df_filtered["TEMP_OUT"].apply(
-                    lambda x: m_round * round(x/m_round) if not np.isnan(x) else np.nan
-                )
     
-    df_filtered["TEMP_GATE M_ROUND"] = df_filtered["TEMP_GATE"].apply(
-                    lambda x: m_round * round(x/m_round) if not np.isnan(x) else np.nan
-                )
+
+def average_chart(df_average,field,field_type,axis_title,chart_title):
+    return alt.Chart(df_average).mark_bar().encode(
+                x=alt.X(f'{field}:{field_type}', title=axis_title),
+                y=alt.Y('avg_kwh:Q', title='Average kWh'),
+                color=alt.Color('avg_kwh:Q', scale=alt.Scale(scheme='viridis'), title='Average kWh'),  # Custom color scale
+                tooltip=[alt.Tooltip(f'{field}:{field_type}', title=axis_title), 
+                        alt.Tooltip('avg_kwh:Q', title='Average kWh'),
+                        alt.Tooltip('count:Q', title='Data Points Count')]  # Adding count to the tooltip
+            ).properties(
+                title=chart_title,
+                width=600,
+                height=400
+            )
+
+
+def show_average_chart(cube,cube_key,system_id,field,field_type,axis_title,chart_title):
+    # Long date ranges are downsampled on the server so the chart payload stays bounded
+    with stage(f"{field} aggregation") as timing:
+        df_average = node(f"{system_id}/general/{field}",cube_key,lambda: downsample(cube_average(cube,[field]),field,'avg_kwh'))
+        timing.rows = len(df_average)
+    with stage(f"{field} chart"):
+        bar_chart = node(f"{system_id}/general/{field}/chart",cube_key,lambda: chart_spec(average_chart(df_average,field,field_type,axis_title,chart_title)))
+                
+    st.vega_lite_chart(bar_chart, use_container_width=True)
+
+
+# Pivot column labels as shown in the tables
+PIVOT_LABELS = {"avg_kwh": "avg_kwh", "kwh_count": "count"}
+
+
+def temperature_aggregates(cube,bin_column,range_slider):
+    cube_range = cube[(cube[bin_column] >= range_slider[0]) & (cube[bin_column] <= range_slider[1])]
+    
+    df_raw_line_raw_plant = cube_average(cube_range,['Installation_Type',bin_column])
+    pivot_sys_1 = cube_pivot(cube_range,bin_column)
+    df_raw_total_savings_plant = cube_average(cube_range,['Installation_Type']).rename(columns={'count':'data_points'})
+    return df_raw_line_raw_plant, pivot_sys_1, df_raw_total_savings_plant
+
+
+def temperature_chart(df_raw_line_raw_plant,bin_column,chart_title):
+    return alt.Chart(df_raw_line_raw_plant).mark_line(point=True, interpolate='cardinal').encode(
+            y='avg_kwh:Q',
+            x=f'{bin_column}:Q',
+            color=alt.Color('Installation_Type:N', scale=alt.Scale(range=['#13661e', '#e81a07'])) ,
+            tooltip=[alt.Tooltip('Installation_Type:N', title='Installation_Type'), 
+                        alt.Tooltip('avg_kwh:Q', title='Average kWh'),
+                        alt.Tooltip(f'{bin_column}:Q', title='Temperature'),
+                        alt.Tooltip('count:Q', title='Data Points Count')]
+        ).properties(
+            title=chart_title,
+            width=600,
+            height=400
+        ).configure_view(
+            strokeOpacity=0  # Remove the border lines around the chart
+        ).configure_axis(
+            grid=True       # Remove gridlines if needed to make the chart cleaner
+        )
+
+
+def show_temperature_tab(cube,cube_key,system_id,bin_column,slider_label,chart_title):
+    slider,space2 = st.columns([1,0.5])
     
+    range_slider = slider.slider(slider_label, cube[bin_column].min(), cube[bin_column].max(),(cube[bin_column].min(),cube[bin_column].max()),0.25)
     
-    def compare_date(x):
-        if pd.to_datetime(x) > pd.to_datetime(instl_dt):
-            return "Post Installation"
-        else:
-            return "Pre Installation"
+    if range_slider:
+        tab_key = (cube_key,bin_column,tuple(range_slider))
+        with stage(f"{bin_column} aggregation",rows=len(cube)):
+            df_raw_line_raw_plant, pivot_sys_1, df_raw_total_savings_plant = node(f"{system_id}/{bin_column}/aggregates",tab_key,lambda: temperature_aggregates(cube,bin_column,range_slider))
+        with stage(f"{bin_column} chart",rows=len(df_raw_line_raw_plant)):
+            chart_plant_room = node(f"{system_id}/{bin_column}/chart",tab_key,lambda: chart_spec(temperature_chart(
+                downsample(df_raw_line_raw_plant,bin_column,'avg_kwh',group_column='Installation_Type'),bin_column,chart_title
+            )))
+            
+        st.vega_lite_chart(chart_plant_room, use_container_width=True)
         
+        # Bootstrap intervals over the binned cube, recomputed only when the range or the filters change
+        with stage(f"{bin_column} savings",rows=len(cube)):
+            savings = node(f"{system_id}/{bin_column}/savings",tab_key,lambda: savings_estimate(cube,bin_column,range_slider))
         
-    df_filtered['Installation_Type'] = df_filtered["Time_stamp"].apply(lambda x: compare_date(x)) 
-    
-    
-    # st.write(df_filtered)
+        # The memoized pivot is shared across reruns, relabel a copy; a period without data simply has no columns
+        pivot_sys_1 = pivot_sys_1.copy()
+        pivot_sys_1.columns = [f"{PIVOT_LABELS[stat]}_{period.split()[0].lower()}" for stat,period in pivot_sys_1.columns]
+        pivot_sys_1 = pivot_sys_1.reset_index()
+        
+        v1,v2 = st.columns([1,1])
         
+        with v1:
+            st.write(":green[Avg KWH Pre vs Post at each Temperature]")
+            st.write(pivot_sys_1)
+        
+        with v2:
+            st.write(":green[Savings Pre Installation VS Post Installation]")
+            st.write(df_raw_total_savings_plant)
+            if savings["savings"] is None:
+                st.warning(savings["message"])
+            else:
+                confidence = round(savings["confidence"] * 100)
+                st.header(f":blue[TOTAL SAVINGS:] :green[{round(savings['savings'],2)}%]")
+                st.write(f":blue[{confidence}% CI:] {savings['savings_low']:.2f}% to {savings['savings_high']:.2f}%")
+                if savings["normalized_savings"] is not None:
+                    st.write(f":blue[Temperature-normalized savings:] :green[{savings['normalized_savings']:.2f}%] "
+                             f"({confidence}% CI {savings['normalized_low']:.2f}% to {savings['normalized_high']:.2f}%, {savings['bins']} bins)")
+                elif savings["message"]:
+                    st.warning(savings["message"])
+                st.caption(f"Day-block bootstrap over {savings['resamples']} resamples")
 
-    st.write(":blue[NO. Of Rows : ]",f":red[{str(len(df_filtered))}]")
-    st.write(":blue[Total NO. Of Rows Removed : ]",f":red[{str(len(df_raw) - len(df_filtered))}]")
-    
-    return df_filtered
+
+# Model labels of the baseline tab
+BASELINE_LABELS = {LINEAR: "Linear", "change_point": "Change-point (cooling)"}
+
+
+def baseline_chart(daily,system_id):
+    # Daily totals of the measured kWh and the weather-normalized baseline, long format for one line per series
+    long = daily.melt(id_vars=["date","Installation_Type"],value_vars=["baseline_kwh","actual_kwh"],var_name="series",value_name="kwh")
+    long["series"] = long["series"].map({"baseline_kwh": "Baseline","actual_kwh": "Actual"})
+    long = downsample(long,"date","kwh",group_column="series")
+    return alt.Chart(long).mark_line().encode(
+                x=alt.X('date:T', title='Date'),
+                y=alt.Y('kwh:Q', title='kWh per day'),
+                color=alt.Color('series:N', scale=alt.Scale(domain=['Baseline','Actual'],range=['#13661e','#e81a07'])),
+                tooltip=[alt.Tooltip('date:T', title='Date'),
+                        alt.Tooltip('series:N', title='Series'),
+                        alt.Tooltip('kwh:Q', title='kWh')]
+            ).properties(
+                title=f"DAILY KWH {system_id.upper()} VS WEATHER-NORMALIZED BASELINE",
+                width=600,
+                height=400
+            )
+
+
+def show_baseline_tab(system_id,instl_dt):
+    model = st.radio(f"Baseline model for {system_id}",MODELS,format_func=BASELINE_LABELS.get,horizontal=True)
+    if str(instl_dt) == str(data[f"Installation Date {system_id}"]):
+        # Every system of the project in one batched fit, shared by all tabs
+        project_dates = {key: data[f"Installation Date {key}"] for key in columns_list}
+        results = node(f"baseline/{model}",(base_key,model),lambda: baseline_savings(df,project_dates,model))
+    else:
+        results = node(f"{system_id}/baseline",(base_key,model,instl_dt),lambda: baseline_savings(df,{system_id: instl_dt},model))
+    result = results[system_id]
     
+    if result["daily"] is not None:
+        chart = node(f"{system_id}/baseline/chart",(base_key,model,instl_dt),lambda: chart_spec(baseline_chart(result["daily"],system_id)))
+        st.vega_lite_chart(chart, use_container_width=True)
+    if result["savings"] is None:
+        st.warning(result["message"])
+        return
     
+    b1,b2,b3,b4 = st.columns(4)
+    b1.metric("Avoided kWh",f"{result['avoided_kwh']:,.1f}")
+    b2.metric("Savings",f"{result['savings']:.2f}%")
+    b3.metric("CV(RMSE)",f"{result['cv_rmse']:.1f}%")
+    b4.metric("NMBE",f"{result['nmbe']:.2f}%")
+    if not result["meets_guideline"]:
+        st.warning(f"The baseline fit is outside the ASHRAE Guideline 14 limits for hourly models (CV(RMSE) ≤ {MAX_CV_RMSE:.0f}%, |NMBE| ≤ {MAX_NMBE:.0f}%), treat the savings as indicative")
+    balance = f", balance point {result['balance_point']:.1f} °C TEMP_OUT" if result["balance_point"] is not None else ""
+    st.caption(f"Fitted on {result['train_hours']} Pre Installation hours against TEMP_OUT, HUMID_OUT, TEMP_GATE, HUMID_GATE, hour of day and weekday{balance}; "
+               f"Post Installation baseline over {result['predict_hours']} hours. Deselections above do not apply to the baseline.")
+
 
 for i,tab in enumerate(tabs):
     with tab:
         system_number = i+1
+        system_id = f'System {system_number}'
         
-        df_filtered = show_input_values(system_number,df,data)
+        with stage(f"{system_id} show_input_values"):
+            row_mask, m_round, instl_dt, cube_key = show_input_values(system_number,df,data,filter_codes,options,base_key)
         
-        tab1,tab2,tab3,tab4 = st.tabs(["General Analysis","Pre/Post Installation Analysis on ∆T","Pre/Post Installation Analysis on TEMP_OUT","Pre/Post Installation Analysis on TEMP_GATE"])
-
-        with tab1:
-            for system_id,circuit_list in data.items():
-                if system_id.startswith(f'System {system_number}'):
-                    x1,x2 = st.columns([1,1])
-                    
-                    with x1:
-                        df_filtered_hour = df_filtered.groupby('Hour').agg( 
-                                                                    avg_kwh=(f"{system_id}_KW_SUM_Average", 'mean'),
-                                                                    count=(f"{system_id}_KW_SUM_Average", 'size')
-                                                                    ).reset_index()
-                        
-                        bar_chart = alt.Chart(df_filtered_hour).mark_bar().encode(
-                                        x=alt.X('Hour:O', title='Hour of Day'),
-                                        y=alt.Y('avg_kwh:Q', title='Average kWh'),
-                                        color=alt.Color('avg_kwh:Q', scale=alt.Scale(scheme='viridis'), title='Average kWh'),  # Custom color scale
-                                        tooltip=[alt.Tooltip('Hour:O', title='Hour'), 
-                                                alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                                alt.Tooltip('count:Q', title='Data Points Count')]  # Adding count to the tooltip
-                                    ).properties(
-                                        title='AVERAGE KWH VS HOUR',
-                                        width=600,
-                                        height=400
-                                    )
-                                    
-                        st.altair_chart(bar_chart, use_container_width=True)
-                        
-                        df_filtered_hour = df_filtered.groupby('week_day').agg( 
-                                                                    avg_kwh=(f"{system_id}_KW_SUM_Average", 'mean'),
-                                                                    count=(f"{system_id}_KW_SUM_Average", 'size')
-                                                                    ).reset_index()
-                        
-                        bar_chart = alt.Chart(df_filtered_hour).mark_bar().encode(
-                                        x=alt.X('week_day:O', title='Week'),
-                                        y=alt.Y('avg_kwh:Q', title='Average kWh'),
-                                        color=alt.Color('avg_kwh:Q', scale=alt.Scale(scheme='viridis'), title='Average kWh'),  # Custom color scale
-                                        tooltip=[alt.Tooltip('week_day:O', title='Week'), 
-                                                alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                                alt.Tooltip('count:Q', title='Data Points Count')]  # Adding count to the tooltip
-                                    ).properties(
-                                        title='AVERAGE KWH VS WEEKDAY',
-                                        width=600,
-                                        height=400
-                                    )
-                                    
-                        st.altair_chart(bar_chart, use_container_width=True)
-                        
-                    with x2:
-                        df_filtered_hour = df_filtered.groupby('date').agg( 
-                                                                    avg_kwh=(f"{system_id}_KW_SUM_Average", 'mean'),
-                                                                    count=(f"{system_id}_KW_SUM_Average", 'size')
-                                                                    ).reset_index()
-                        
-                        bar_chart = alt.Chart(df_filtered_hour).mark_bar().encode(
-                                        x=alt.X('date:T', title='Date'),
-                                        y=alt.Y('avg_kwh:Q', title='Average kWh'),
-                                        color=alt.Color('avg_kwh:Q', scale=alt.Scale(scheme='viridis'), title='Average kWh'),  # Custom color scale
-                                        tooltip=[alt.Tooltip('date:T', title='Date'), 
-                                                alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                                alt.Tooltip('count:Q', title='Data Points Count')]  # Adding count to the tooltip
-                                    ).properties(
-                                        title='AVERAGE KWH VS DATE',
-                                        width=600,
-                                        height=400
-                                    )
-                                    
-                        st.altair_chart(bar_chart, use_container_width=True)
-                        
-                        df_filtered_hour = df_filtered.groupby('day').agg( 
-                                                                    avg_kwh=(f"{system_id}_KW_SUM_Average", 'mean'),
-                                                                    count=(f"{system_id}_KW_SUM_Average", 'size')
-                                                                    ).reset_index()
-                        
-                        bar_chart = alt.Chart(df_filtered_hour).mark_bar().encode(
-                                        x=alt.X('day:O', title='Day'),
-                                        y=alt.Y('avg_kwh:Q', title='Average kWh'),
-                                        color=alt.Color('avg_kwh:Q', scale=alt.Scale(scheme='viridis'), title='Average kWh'),  # Custom color scale
-                                        tooltip=[alt.Tooltip('day:O', title='Day'), 
-                                                alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                                alt.Tooltip('count:Q', title='Data Points Count')]  # Adding count to the tooltip
-                                    ).properties(
-                                        title='AVERAGE KWH VS Day',
-                                        width=600,
-                                        height=400
-                                    )
-                                    
-                        st.altair_chart(bar_chart, use_container_width=True)
+        # Every chart and table below re-aggregates these summaries instead of the raw rows
+        with stage(f"{system_id} cubes",rows=len(df)):
+            cubes = node(f"{system_id}/cubes",cube_key,lambda: system_cubes(df,system_id,row_mask,m_round,instl_dt))
         
-        with tab2:
-            
-            slider,space2 = st.columns([1,0.5])
-            
-            df_filtered_tab2 = df_filtered.copy()
-            
-            range_slider = slider.slider(f":green[Select Temperature Range for System {system_number}]", df_filtered_tab2["∆T M_ROUND"].min(), df_filtered_tab2["∆T M_ROUND"].max(),(df_filtered_tab2["∆T M_ROUND"].min(),df_filtered_tab2["∆T M_ROUND"].max()),0.25)
-            
-            if range_slider:
-                df_filtered_tab2 = df_filtered_tab2[df_filtered_tab2['∆T M_ROUND'] >= range_slider[0]]
-                df_filtered_tab2 = df_filtered_tab2[df_filtered_tab2['∆T M_ROUND'] <= range_slider[1]]
-                
-                df_raw_line_raw_plant = df_filtered_tab2.groupby(['Installation_Type','∆T M_ROUND']).agg(
-                        avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                        count=(f'System {system_number}_KW_SUM_Average', 'size')
-                    ).reset_index()
-                
-                chart_plant_room = alt.Chart(df_raw_line_raw_plant).mark_line(point=True, interpolate='cardinal').encode(
-                        y='avg_kwh:Q',
-                        x='∆T M_ROUND:Q',
-                        color=alt.Color('Installation_Type:N', scale=alt.Scale(range=['#13661e', '#e81a07'])) ,
-                        tooltip=[alt.Tooltip('Installation_Type:N', title='Installation_Type'), 
-                                    alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                    alt.Tooltip('∆T M_ROUND:Q', title='Temperature'),
-                                    alt.Tooltip('count:Q', title='Data Points Count')]
-                    ).properties(
-                        title="AVERAGE ENERGY CONSUMPTIONS SYSTEM 1 VS ∆T TEMPERATURE PRE & POST INSTALLATION",
-                        width=600,
-                        height=400
-                    ).configure_view(
-                        strokeOpacity=0  # Remove the border lines around the chart
-                    ).configure_axis(
-                        grid=True       # Remove gridlines if needed to make the chart cleaner
-                    )
-                    
-                st.altair_chart(chart_plant_room, use_container_width=True)
-                
-                pivot_sys_1 = pd.pivot_table(df_filtered_tab2, 
-                            index='∆T M_ROUND', 
-                            columns='Installation_Type', 
-                            values=f'System {system_number}_KW_SUM_Average', 
-                            aggfunc=['mean', 'count'])
-                try:
-                    pivot_sys_1.columns = ['avg_kwh_post', 'avg_kwh_pre', 'count_post', 'count_pre']
-                    pivot_sys_1 = pivot_sys_1.reset_index()
-                    
-                    v1,v2 = st.columns([1,1])
-                    
-                    with v1:
-                        st.write(":green[Avg KWH Pre vs Post at each Temperature]")
-                        st.write(pivot_sys_1)
-                    
-                    with v2:
-                        df_raw_total_savings_plant = df_filtered_tab2.groupby(['Installation_Type']).agg(
-                                avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                                data_points=(f'System {system_number}_KW_SUM_Average','size')
-                            ).reset_index()
-                        
-                        st.write(":green[Savings Pre Installation VS Post Installation]")
-                        st.write(df_raw_total_savings_plant)
-                        post_kwh = float(df_raw_total_savings_plant[df_raw_total_savings_plant["Installation_Type"] == "Post Installation"]["avg_kwh"])
-                        pre_kwh = float(df_raw_total_savings_plant[df_raw_total_savings_plant["Installation_Type"] == "Pre Installation"]["avg_kwh"])
-                        savings = ((pre_kwh - post_kwh)/pre_kwh)*100
-                        st.header(f":blue[TOTAL SAVINGS:] :green[{round(savings,2)}%]")
-                except Exception as e:
-                    pivot_sys_1.columns = ['avg_kwh_pre', 'count_pre']
-                    pivot_sys_1 = pivot_sys_1.reset_index()
-                    
-                    v1,v2 = st.columns([1,1])
-                    
-                    with v1:
-                        st.write(":green[Avg KWH Pre vs Post at each Temperature]")
-                        st.write(pivot_sys_1)
-                
-                    with v2:
-                        df_raw_total_savings_plant = df_filtered_tab2.groupby(['Installation_Type']).agg(
-                                avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                                data_points=(f'System {system_number}_KW_SUM_Average','size')
-                            ).reset_index()
-                        
-                        st.write(":green[Savings Pre Installation VS Post Installation]")
-                        st.write(df_raw_total_savings_plant)
-
-        with tab3:
-            slider,space2 = st.columns([1,0.5])
-            
-            df_filtered_tab3 = df_filtered.copy()
-            
-            range_slider = slider.slider(f":green[Select TEMP_OUT Temperature Range for System {system_number}]", df_filtered_tab3["TEMP_OUT M_ROUND"].min(), df_filtered_tab3["TEMP_OUT M_ROUND"].max(),(df_filtered_tab3["TEMP_OUT M_ROUND"].min(),df_filtered_tab3["TEMP_OUT M_ROUND"].max()),0.25)
-            
-            if range_slider:
-                df_filtered_tab3 = df_filtered_tab3[df_filtered_tab3['TEMP_OUT M_ROUND'] >= range_slider[0]]
-                df_filtered_tab3 = df_filtered_tab3[df_filtered_tab3['TEMP_OUT M_ROUND'] <= range_slider[1]]
-                
-                df_raw_line_raw_plant = df_filtered_tab3.groupby(['Installation_Type','TEMP_OUT M_ROUND']).agg(
-                        avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                        count=(f'System {system_number}_KW_SUM_Average', 'size')
-                    ).reset_index()
-                
-                chart_plant_room = alt.Chart(df_raw_line_raw_plant).mark_line(point=True, interpolate='cardinal').encode(
-                        y='avg_kwh:Q',
-                        x='TEMP_OUT M_ROUND:Q',
-                        color=alt.Color('Installation_Type:N', scale=alt.Scale(range=['#13661e', '#e81a07'])) ,
-                        tooltip=[alt.Tooltip('Installation_Type:N', title='Installation_Type'), 
-                                    alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                    alt.Tooltip('TEMP_OUT M_ROUND:Q', title='Temperature'),
-                                    alt.Tooltip('count:Q', title='Data Points Count')]
-                    ).properties(
-                        title="AVERAGE ENERGY CONSUMPTIONS SYSTEM 1 VS TEMP_OUT TEMPERATURE PRE & POST INSTALLATION",
-                        width=600,
-                        height=400
-                    ).configure_view(
-                        strokeOpacity=0  # Remove the border lines around the chart
-                    ).configure_axis(
-                        grid=True       # Remove gridlines if needed to make the chart cleaner
-                    )
-                    
-                st.altair_chart(chart_plant_room, use_container_width=True)
-                
-                pivot_sys_1 = pd.pivot_table(df_filtered_tab3, 
-                            index='TEMP_OUT M_ROUND', 
-                            columns='Installation_Type', 
-                            values=f'System {system_number}_KW_SUM_Average', 
-                            aggfunc=['mean', 'count'])
-                try:
-                    pivot_sys_1.columns = ['avg_kwh_post', 'avg_kwh_pre', 'count_post', 'count_pre']
-                    pivot_sys_1 = pivot_sys_1.reset_index()
-                    
-                    v1,v2 = st.columns([1,1])
-                    
-                    with v1:
-                        st.write(":green[Avg KWH Pre vs Post at each Temperature]")
-                        st.write(pivot_sys_1)
-                    
-                    with v2:
-                        df_raw_total_savings_plant = df_filtered_tab3.groupby(['Installation_Type']).agg(
-                                avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                                data_points=(f'System {system_number}_KW_SUM_Average','size')
-                            ).reset_index()
-                        
-                        st.write(":green[Savings Pre Installation VS Post Installation]")
-                        st.write(df_raw_total_savings_plant)
-                        post_kwh = float(df_raw_total_savings_plant[df_raw_total_savings_plant["Installation_Type"] == "Post Installation"]["avg_kwh"])
-                        pre_kwh = float(df_raw_total_savings_plant[df_raw_total_savings_plant["Installation_Type"] == "Pre Installation"]["avg_kwh"])
-                        savings = ((pre_kwh - post_kwh)/pre_kwh)*100
-                        st.header(f":blue[TOTAL SAVINGS:] :green[{round(savings,2)}%]")
-                except Exception as e:
-                    pivot_sys_1.columns = ['avg_kwh_pre', 'count_pre']
-                    pivot_sys_1 = pivot_sys_1.reset_index()
-                    
-                    v1,v2 = st.columns([1,1])
-                    
-                    with v1:
-                        st.write(":green[Avg KWH Pre vs Post at each Temperature]")
-                        st.write(pivot_sys_1)
-                
-                    with v2:
-                        df_raw_total_savings_plant = df_filtered_tab3.groupby(['Installation_Type']).agg(
-                                avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                                data_points=(f'System {system_number}_KW_SUM_Average','size')
-                            ).reset_index()
-                        
-                        st.write(":green[Savings Pre Installation VS Post Installation]")
-                        st.write(df_raw_total_savings_plant)
-        with tab4:
-            slider,space2 = st.columns([1,0.5])
-            
-            df_filtered_tab3 = df_filtered.copy()
-            
-            range_slider = slider.slider(f":green[Select TEMP_GATE Temperature Range for System {system_number}]", df_filtered_tab3["TEMP_GATE M_ROUND"].min(), df_filtered_tab3["TEMP_GATE M_ROUND"].max(),(df_filtered_tab3["TEMP_GATE M_ROUND"].min(),df_filtered_tab3["TEMP_GATE M_ROUND"].max()),0.25)
+        tab1,tab2,tab3,tab4,tab5 = st.tabs(["General Analysis","Pre/Post Installation Analysis on ∆T","Pre/Post Installation Analysis on TEMP_OUT","Pre/Post Installation Analysis on TEMP_GATE","Weather-Normalized Baseline"])
+
+        with tab1, stage(f"{system_id} General Analysis"):
+            cube = cubes["∆T M_ROUND"]
+            x1,x2 = st.columns([1,1])
             
-            if range_slider:
-                df_filtered_tab3 = df_filtered_tab3[df_filtered_tab3['TEMP_GATE M_ROUND'] >= range_slider[0]]
-                df_filtered_tab3 = df_filtered_tab3[df_filtered['TEMP_GATE M_ROUND'] <= range_slider[1]]
-                
-                df_raw_line_raw_plant = df_filtered_tab3.groupby(['Installation_Type','TEMP_GATE M_ROUND']).agg(
-                        avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                        count=(f'System {system_number}_KW_SUM_Average', 'size')
-                    ).reset_index()
+            with x1:
+                show_average_chart(cube,cube_key,system_id,'Hour','O','Hour of Day','AVERAGE KWH VS HOUR')
+                show_average_chart(cube,cube_key,system_id,'week_day','O','Week','AVERAGE KWH VS WEEKDAY')
                 
-                chart_plant_room = alt.Chart(df_raw_line_raw_plant).mark_line(point=True, interpolate='cardinal').encode(
-                        y='avg_kwh:Q',
-                        x='TEMP_GATE M_ROUND:Q',
-                        color=alt.Color('Installation_Type:N', scale=alt.Scale(range=['#13661e', '#e81a07'])) ,
-                        tooltip=[alt.Tooltip('Installation_Type:N', title='Installation_Type'), 
-                                    alt.Tooltip('avg_kwh:Q', title='Average kWh'),
-                                    alt.Tooltip('TEMP_GATE M_ROUND:Q', title='Temperature'),
-                                    alt.Tooltip('count:Q', title='Data Points Count')]
-                    ).properties(
-                        title="AVERAGE ENERGY CONSUMPTIONS SYSTEM 1 VS TEMP_GATE TEMPERATURE PRE & POST INSTALLATION",
-                        width=600,
-                        height=400
-                    ).configure_view(
-                        strokeOpacity=0  # Remove the border lines around the chart
-                    ).configure_axis(
-                        grid=True       # Remove gridlines if needed to make the chart cleaner
-                    )
-                    
-                st.altair_chart(chart_plant_room, use_container_width=True)
-                
-                pivot_sys_1 = pd.pivot_table(df_filtered_tab3, 
-                            index='TEMP_GATE M_ROUND', 
-                            columns='Installation_Type', 
-                            values=f'System {system_number}_KW_SUM_Average', 
-                            aggfunc=['mean', 'count'])
-                try:
-                    pivot_sys_1.columns = ['avg_kwh_post', 'avg_kwh_pre', 'count_post', 'count_pre']
-                    pivot_sys_1 = pivot_sys_1.reset_index()
-                    
-                    v1,v2 = st.columns([1,1])
-                    
-                    with v1:
-                        st.write(":green[Avg KWH Pre vs Post at each Temperature]")
-                        st.write(pivot_sys_1)
-                    
-                    with v2:
-                        df_raw_total_savings_plant = df_filtered_tab3.groupby(['Installation_Type']).agg(
-                                avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                                data_points=(f'System {system_number}_KW_SUM_Average','size')
-                            ).reset_index()
-                        
-                        st.write(":green[Savings Pre Installation VS Post Installation]")
-                        st.write(df_raw_total_savings_plant)
-                        post_kwh = float(df_raw_total_savings_plant[df_raw_total_savings_plant["Installation_Type"] == "Post Installation"]["avg_kwh"])
-                        pre_kwh = float(df_raw_total_savings_plant[df_raw_total_savings_plant["Installation_Type"] == "Pre Installation"]["avg_kwh"])
-                        savings = ((pre_kwh - post_kwh)/pre_kwh)*100
-                        st.header(f":blue[TOTAL SAVINGS:] :green[{round(savings,2)}%]")
-                except Exception as e:
-                    pivot_sys_1.columns = ['avg_kwh_pre', 'count_pre']
-                    pivot_sys_1 = pivot_sys_1.reset_index()
-                    
-                    v1,v2 = st.columns([1,1])
-                    
-                    with v1:
-                        st.write(":green[Avg KWH Pre vs Post at each Temperature]")
-                        st.write(pivot_sys_1)
-                
-                    with v2:
-                        df_raw_total_savings_plant = df_filtered_tab3.groupby(['Installation_Type']).agg(
-                                avg_kwh=(f'System {system_number}_KW_SUM_Average', 'mean'),
-                                data_points=(f'System {system_number}_KW_SUM_Average','size')
-                            ).reset_index()
-                        
-                        st.write(":green[Savings Pre Installation VS Post Installation]")
-                        st.write(df_raw_total_savings_plant)
+            with x2:
+                show_average_chart(cube,cube_key,system_id,'date','T','Date','AVERAGE KWH VS DATE')
+                show_average_chart(cube,cube_key,system_id,'day','O','Day','AVERAGE KWH VS Day')
+        
+        with tab2, stage(f"{system_id} ∆T tab"):
+            show_temperature_tab(cubes["∆T M_ROUND"],cube_key,system_id,"∆T M_ROUND",f":green[Select Temperature Range for System {system_number}]","AVERAGE ENERGY CONSUMPTIONS SYSTEM 1 VS ∆T TEMPERATURE PRE & POST INSTALLATION")
+
+        with tab3, stage(f"{system_id} TEMP_OUT tab"):
+            show_temperature_tab(cubes["TEMP_OUT M_ROUND"],cube_key,system_id,"TEMP_OUT M_ROUND",f":green[Select TEMP_OUT Temperature Range for System {system_number}]","AVERAGE ENERGY CONSUMPTIONS SYSTEM 1 VS TEMP_OUT TEMPERATURE PRE & POST INSTALLATION")
             
-                            
-                        
\ No newline at end of file
+        with tab4, stage(f"{system_id} TEMP_GATE tab"):
+            show_temperature_tab(cubes["TEMP_GATE M_ROUND"],cube_key,system_id,"TEMP_GATE M_ROUND",f":green[Select TEMP_GATE Temperature Range for System {system_number}]","AVERAGE ENERGY CONSUMPTIONS SYSTEM 1 VS TEMP_GATE TEMPERATURE PRE & POST INSTALLATION")
+
+        with tab5, stage(f"{system_id} baseline tab"):
+            show_baseline_tab(system_id,instl_dt)
+
+show_report()
+
+cache_stats = dataset_cache.stats()
+st.caption(f"Dataset cache: {cache_stats['projects']} projects in {cache_stats['entries']} periods, {cache_stats['size_bytes'] / 1024 ** 2:.1f} of {cache_stats['budget_bytes'] / 1024 ** 2:.0f} MB, {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['evictions']} evictions")
+
+show_debug_panel()
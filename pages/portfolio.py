@@ -0,0 +1,83 @@
+import streamlit as st
+import pandas as pd
+from ingest_jobs import submit_summary
+from portfolio_summary import ANALYSES, stale_projects
+from profiling import begin_timing, debug_flags, show_debug_panel, stage
+from project_registry import ProjectRegistry
+
+# Stage timings go to the log on every rerun, the panel is opt-in with ?debug=1
+debug, profile = debug_flags()
+begin_timing("portfolio",debug,profile)
+
+st.title(":green[Portfolio]")
+
+registry = ProjectRegistry()
+
+# Served from the summary tables only, projects whose files changed are recomputed in the background
+with stage("stale check") as timing:
+    stale = stale_projects(registry)
+    timing.rows = len(stale)
+for project_name in stale:
+    submit_summary(registry,project_name)
+
+analysis = st.radio("Analysis",ANALYSES,horizontal=True)
+
+with stage("summary table") as timing:
+    summary = pd.DataFrame(registry.portfolio(analysis))
+    timing.rows = len(summary)
+
+if summary.empty:
+    st.info("No saved project has a summary yet.")
+else:
+    systems = summary[summary["system"].notna()]
+    m1,m2,m3,m4 = st.columns(4)
+    m1.metric("Projects",summary["project"].nunique())
+    m2.metric("Systems",len(systems))
+    m3.metric("Median Savings",f"{systems['savings'].median():.2f}%" if systems["savings"].notna().any() else "-")
+    m4.metric("Total Readings",f"{int(summary.drop_duplicates('project')['rows'].fillna(0).sum()):,}")
+
+    table = summary.assign(
+        coverage=summary["coverage"] * 100,
+        updated=pd.to_datetime(summary["updated"],unit="s").dt.strftime("%Y-%m-%d %H:%M"),
+    )
+    st.dataframe(
+        table[["project","system","installation_date","pre_kwh","post_kwh","savings","savings_low","savings_high",
+               "normalized_savings","pre_points","post_points","rows","first_reading","last_reading","coverage","updated"]],
+        hide_index=True,
+        column_config={
+            "project": "Project",
+            "system": "System",
+            "installation_date": "Installation Date",
+            "pre_kwh": st.column_config.NumberColumn("Pre kWh",format="%.3f"),
+            "post_kwh": st.column_config.NumberColumn("Post kWh",format="%.3f"),
+            "savings": st.column_config.NumberColumn("Savings %",format="%.2f"),
+            "savings_low": st.column_config.NumberColumn("CI Low %",format="%.2f"),
+            "savings_high": st.column_config.NumberColumn("CI High %",format="%.2f"),
+            "normalized_savings": st.column_config.NumberColumn("Normalized %",format="%.2f"),
+            "pre_points": "Pre Points",
+            "post_points": "Post Points",
+            "rows": "Readings",
+            "first_reading": "First Reading",
+            "last_reading": "Last Reading",
+            "coverage": st.column_config.ProgressColumn("Days Covered",format="%.0f%%",min_value=0,max_value=100),
+            "updated": "Updated",
+        },
+    )
+
+    for row in summary[summary["error"].notna()].drop_duplicates("project").itertuples():
+        st.error(f"{row.project}: {row.error}")
+
+if stale:
+    st.caption(f"Refreshing in the background: {', '.join(stale)}")
+    st.button("Reload")
+
+# Opening one project still loads its rows, only on request
+c1,c2 = st.columns([3,1])
+project_name = c1.selectbox("Project",registry.project_names(),index=None)
+if c2.button("Check Analysis",disabled=project_name is None):
+    from streamlit_extras.switch_page_button import switch_page
+
+    st.session_state.project_name = project_name
+    switch_page("analysis")
+
+show_debug_panel()
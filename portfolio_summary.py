@@ -0,0 +1,85 @@
+import argparse
+import datetime
+import hashlib
+import json
+import sys
+import time
+
+from project_registry import REGISTRY_FILE, ProjectRegistry
+
+# Same labels as the analysis column of batch_analysis.py
+ANALYSES = ["∆T", "TEMP_OUT", "TEMP_GATE"]
+
+
+def summary_version(folder):
+    # Changes with the project JSON and the data files, like the dataset cache version
+    from dataset_cache import dataset_version
+
+    return hashlib.sha1(json.dumps(dataset_version(folder)).encode()).hexdigest()
+
+
+def data_coverage(catalog):
+    # Rows and reading period from the catalog, coverage is the share of calendar days in it with readings
+    summary = {"rows": catalog["rows"], "first_reading": catalog["time_min"], "last_reading": catalog["time_max"],
+               "days": len(catalog["values"]["date"]), "coverage": None}
+    if catalog["time_min"] is not None:
+        first = datetime.date.fromisoformat(catalog["time_min"][:10])
+        last = datetime.date.fromisoformat(catalog["time_max"][:10])
+        summary["coverage"] = summary["days"] / ((last - first).days + 1)
+    return summary
+
+
+def refresh_summary(registry, project_name):
+    # Versioned before reading, a change made meanwhile leaves the summary stale and it is refreshed again
+    from batch_analysis import project_savings
+    from data_store import project_catalog
+
+    folder = registry.folder(project_name)
+    version = summary_version(folder)
+    try:
+        summary = data_coverage(project_catalog(folder))
+        systems = project_savings(project_name, folder)
+        summary["error"] = None
+    except Exception as e:
+        # Recorded with its version, so a broken project is not retried until its files change
+        summary, systems = {"error": f"{type(e).__name__}: {e}"}, []
+    registry.save_summary(project_name, version, summary, systems)
+    return summary
+
+
+def stale_projects(registry):
+    # Active projects whose files changed since their summary, from file stats only
+    versions = registry.summary_versions()
+    stale = []
+    for project_name in registry.project_names():
+        try:
+            version = summary_version(registry.folder(project_name))
+        except (OSError, IndexError):
+            # Folder being replaced or without its JSON yet
+            continue
+        if versions.get(project_name) != version:
+            stale.append(project_name)
+    return stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring the portfolio summaries of the saved projects up to date")
+    parser.add_argument("--registry", default=REGISTRY_FILE)
+    parser.add_argument("--all", action="store_true", help="recompute every project, not only those whose files changed")
+    args = parser.parse_args(argv)
+
+    registry = ProjectRegistry(args.registry)
+    projects = registry.project_names() if args.all else stale_projects(registry)
+    failed = 0
+    for project_name in projects:
+        start = time.perf_counter()
+        summary = refresh_summary(registry, project_name)
+        failed += summary["error"] is not None
+        status = f"failed ({summary['error']})" if summary["error"] else f"{summary['rows']} rows"
+        print(f"{project_name}: {time.perf_counter() - start:.2f}s, {status}")
+    print(f"{len(projects)} projects refreshed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+
+PRE_INSTALLATION = "Pre Installation"
+POST_INSTALLATION = "Post Installation"
+# Alphabetical, like the strings this categorical replaces
+INSTALLATION_TYPES = [POST_INSTALLATION, PRE_INSTALLATION]
+
+# Temperatures are stored as float32, rounding the float64 upcast back to the meters'
+# decimals keeps ties (e.g. 7.25 with m_round 0.5) binning like the original values
+TEMPERATURE_DECIMALS = 4
+
+FILTER_COLUMNS = ["Hour", "day", "month", "week_day", "date"]
+
+
+def m_round_bin(values, m_round):
+    # np.round rounds halves to even like Python's round(), NaN stays NaN
+    values = np.asarray(values, dtype="float64")
+    return np.round(values / m_round) * m_round
+
+
+def installation_period(time_stamps, installation_date):
+    # Readings after the installation date are Post, everything else (incl. NaT) is Pre
+    time_stamps = pd.to_datetime(pd.Series(time_stamps)).to_numpy()
+    is_post = time_stamps > np.datetime64(pd.Timestamp(installation_date))
+    return pd.Categorical.from_codes(np.where(is_post, 0, 1), categories=INSTALLATION_TYPES)
+
+
+# Rows per circuit block product, bounds the float64 copy of the readings
+SUM_CHUNK_ROWS = 4096
+
+
+def hourly_buckets(time_stamps, freq="h"):
+    # One sorted pass over a floored datetime64 key: the row order, bucket starts and sizes, the bucket
+    # times and the bucket index of every row (-1 where Time_stamp is NaT), reusable for any value columns
+    buckets = pd.DatetimeIndex(time_stamps).floor(freq)
+    valid = ~buckets.isna()
+    keys = buckets.asi8
+
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(keys[order], kind="stable")]
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(order) else np.array([], dtype="int64")
+    sizes = np.diff(np.r_[starts, len(order)])
+
+    codes = np.full(len(buckets), -1, dtype="int64")
+    codes[order] = np.repeat(np.arange(len(starts)), sizes)
+    return order, starts, sizes, buckets.to_numpy()[order][starts], codes
+
+
+def bucket_means(values, order, starts):
+    values = values[order]
+    if len(order):
+        sums = np.add.reduceat(np.nan_to_num(values), starts, axis=0)
+        counts = np.add.reduceat(~np.isnan(values), starts, axis=0)
+    else:
+        sums = counts = np.zeros((0, values.shape[1]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def system_columns(df):
+    return [column for column in df.columns if column.startswith("System") and column.endswith(("_KW_SUM", "_KW_SUM_Average"))]
+
+
+def circuit_block(df):
+    # Every circuit as one contiguous float32 matrix, rows x circuits
+    circuits = [column for column in df.columns if column.startswith("C_")]
+    return circuits, np.ascontiguousarray(df[circuits].to_numpy(dtype="float32"))
+
+
+def assignment_matrix(circuits, data):
+    # circuits x systems, 1 where the project JSON assigns the circuit to the system
+    systems = [key for key in data if key.startswith("System")]
+    index = {circuit: i for i, circuit in enumerate(circuits)}
+    assignment = np.zeros((len(circuits), len(systems)))
+    for j, key in enumerate(systems):
+        missing = [circuit for circuit in data[key] if circuit not in index]
+        if missing:
+            raise KeyError(f"{missing} not in index")
+        # A circuit listed twice counts twice, like summing the selected columns did
+        np.add.at(assignment[:, j], [index[circuit] for circuit in data[key]], 1.0)
+    return systems, assignment
+
+
+def circuit_sums(block, assignment, out=None, chunk_rows=SUM_CHUNK_ROWS):
+    # rows x systems sums of the circuit block, the float64 copy of the readings is one reused chunk buffer
+    if out is None:
+        out = np.empty((len(block), assignment.shape[1]))
+    buffer = np.empty((min(chunk_rows, len(block)), block.shape[1]))
+    missing = np.empty(buffer.shape, dtype=bool)
+    product = np.empty((len(buffer), assignment.shape[1]))
+    for start in range(0, len(block), chunk_rows):
+        rows = len(block[start:start + chunk_rows])
+        chunk = buffer[:rows]
+        chunk[...] = block[start:start + rows]
+        # Missing readings count as 0, like a skipna sum
+        np.isnan(chunk, out=missing[:rows])
+        np.copyto(chunk, 0.0, where=missing[:rows])
+        np.matmul(chunk, assignment, out=product[:rows])
+        out[start:start + rows] = product[:rows]
+    return out
+
+
+def hourly_averages(sums, buckets, out=None):
+    # Mean of each row's hourly bucket, NaN where Time_stamp is NaT
+    order, starts, sizes, times, codes = buckets
+    if out is None:
+        out = np.empty(sums.shape)
+    if len(starts):
+        # The sums have no NaN, every reading of an hour counts
+        hourly = np.add.reduceat(sums[order], starts, axis=0) / sizes[:, None]
+        out[:] = hourly[np.maximum(codes, 0)]
+    out[codes < 0] = np.nan
+    return out
+
+
+def add_system_sums(df, data, buckets=None, chunk_rows=SUM_CHUNK_ROWS):
+    # Sums of every system from one product of the circuit block with the assignment matrix, then the hourly
+    # averages, all written into one pre-allocated block. Sums of a previous assignment are replaced, so an
+    # edited project JSON only costs this product, pass the hourly_buckets of the frame to reuse them.
+    circuits, block = circuit_block(df)
+    systems, assignment = assignment_matrix(circuits, data)
+    if buckets is None:
+        buckets = hourly_buckets(df["Time_stamp"])
+
+    # Fortran order: every column is contiguous, as pandas stores it
+    values = np.empty((len(df), 2 * len(systems)), order="F")
+    sums = circuit_sums(block, assignment, values[:, :len(systems)], chunk_rows)
+    hourly_averages(sums, buckets, values[:, len(systems):])
+
+    columns = [f"{key}_KW_SUM" for key in systems] + [f"{key}_KW_SUM_Average" for key in systems]
+    system_frame = pd.DataFrame(values, index=df.index, columns=columns, copy=False)
+    return pd.concat([df.drop(columns=system_columns(df)), system_frame], axis=1)
+
+
+def build_filter_codes(df):
+    # Integer code per row and the value each code stands for, computed once per dataset
+    filter_codes = {}
+    for column in FILTER_COLUMNS:
+        if column == "date":
+            codes, uniques = pd.factorize(df["date"], sort=True)
+            options = [np.datetime64(int(day), "D").astype(object) for day in uniques]
+        else:
+            codes, uniques = pd.factorize(df[column], sort=True)
+            options = list(np.asarray(uniques).tolist())
+        filter_codes[column] = (codes.astype("int32"), options)
+    return filter_codes
+
+
+def deselect_mask(filter_codes, deselected):
+    # One boolean mask for all deselections instead of a filtered copy per filter
+    mask = None
+    for column, values in deselected.items():
+        if not values:
+            continue
+        codes, options = filter_codes[column]
+        lookup = {option: code for code, option in enumerate(options)}
+        selected_codes = [lookup[value] for value in values if value in lookup]
+        keep = np.isin(codes, selected_codes, invert=True)
+        mask = keep if mask is None else mask & keep
+    return mask
+
+
+def filtered_view(df, mask, columns):
+    # Only the columns the analysis reads are gathered, the base frame is never modified
+    if mask is None:
+        return df[columns]
+    return df.loc[mask, columns]
+
+
+def add_m_round_columns(df, m_round, installation_date):
+    temp_out = np.round(df["TEMP_OUT"].to_numpy(dtype="float64"), TEMPERATURE_DECIMALS)
+    temp_gate = np.round(df["TEMP_GATE"].to_numpy(dtype="float64"), TEMPERATURE_DECIMALS)
+    df["∆T"] = temp_out - temp_gate
+    df["∆T M_ROUND"] = m_round_bin(df["∆T"], m_round)
+    df["TEMP_OUT M_ROUND"] = m_round_bin(temp_out, m_round)
+    df["TEMP_GATE M_ROUND"] = m_round_bin(temp_gate, m_round)
+    df["Installation_Type"] = installation_period(df["Time_stamp"], installation_date)
+    return df
+
+
+TEMPERATURE_BINS = ["∆T M_ROUND", "TEMP_OUT M_ROUND", "TEMP_GATE M_ROUND"]
+CUBE_KEYS = ["date", "Hour", "Installation_Type"]
+
+
+def build_cube(df, value_column, bin_column):
+    # NaN keys are kept so re-aggregating over other dimensions sees every row
+    cube = df.groupby(CUBE_KEYS + [bin_column], dropna=False, sort=False, observed=True).agg(
+        kwh_sum=(value_column, 'sum'),
+        kwh_count=(value_column, 'count'),
+        size=(value_column, 'size')
+    ).reset_index()
+    # Day ordinals become real dates only on the (small) cube, for the charts
+    dates = pd.to_datetime(cube["date"].astype("float64"), unit="D")
+    cube["date"] = dates
+    cube["week_day"] = dates.dt.day_name()
+    cube["day"] = dates.dt.day
+    return cube
+
+
+def build_system_cubes(df, system_id):
+    value_column = f"{system_id}_KW_SUM_Average"
+    return {bin_column: build_cube(df, value_column, bin_column) for bin_column in TEMPERATURE_BINS}
+
+
+def _reaggregate(cube, by):
+    grouped = cube.groupby(by, observed=True).agg(
+        kwh_sum=('kwh_sum', 'sum'),
+        kwh_count=('kwh_count', 'sum'),
+        count=('size', 'sum')
+    ).reset_index()
+    grouped["avg_kwh"] = grouped["kwh_sum"] / grouped["kwh_count"].where(grouped["kwh_count"] > 0)
+    return grouped
+
+
+def cube_average(cube, by):
+    # Same result as df.groupby(by) mean/size on the raw rows
+    return _reaggregate(cube, by)[by + ["avg_kwh", "count"]]
+
+
+def cube_pivot(cube, bin_column):
+    # Same layout as pivot_table(index=bin, columns=Installation_Type, aggfunc=['mean','count'])
+    grouped = _reaggregate(cube, [bin_column, "Installation_Type"])
+    grouped = grouped[grouped["kwh_count"] > 0]
+    return grouped.pivot(index=bin_column, columns="Installation_Type", values=["avg_kwh", "kwh_count"])
@@ -0,0 +1,197 @@
+import cProfile
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# Kept outside the app folder, next to the project folders only projects belong
+LOG_DIR = os.environ.get("ENERGY_LOG_DIR", os.path.join(os.path.expanduser("~"), ".energy_dashboard"))
+LOG_FILE = "timings.log"
+
+# Each Streamlit session runs its script in its own thread
+_state = threading.local()
+_logger = None
+
+# tracemalloc is process wide: it runs while any debug rerun holds it, and since every stage resets the one
+# peak counter, a stage overlapped by another debug rerun gets no peak instead of a mixed one
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_joins = 0
+_tracing_started = False
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        _logger = logging.getLogger("energy_dashboard.timings")
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        handler = RotatingFileHandler(os.path.join(LOG_DIR, LOG_FILE), maxBytes=5 * 1024 * 1024, backupCount=5)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _logger.addHandler(handler)
+    return _logger
+
+
+class Stage:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.seconds = None
+        self.peak_bytes = None
+        self._peak_seen = 0
+        self._start_bytes = 0
+        self._joins = 0
+        self._shared = False
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_joins, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0:
+            # Tracing switched on outside the app (python -X tracemalloc) is left running
+            _tracing_started = not tracemalloc.is_tracing()
+            if _tracing_started:
+                tracemalloc.start()
+        _tracing_users += 1
+        _tracing_joins += 1
+    _state.tracing = True
+
+
+def _stop_tracing():
+    global _tracing_users
+    if not getattr(_state, "tracing", False):
+        return
+    _state.tracing = False
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+
+
+def _tracing_shared():
+    with _tracing_lock:
+        return _tracing_users > 1, _tracing_joins
+
+
+def begin_timing(page, debug=False, profile=False):
+    # A rerun interrupted by st.rerun()/switch_page never reached finish_timing()
+    if getattr(_state, "profiler", None) is not None:
+        _state.profiler.disable()
+    _stop_tracing()
+    _state.page = page
+    _state.stages = []
+    _state.stack = []
+    _state.debug = debug
+    _state.start = time.perf_counter()
+    # Memory tracing slows allocations down, it only runs when the debug panel is on
+    if debug:
+        _start_tracing()
+    _state.profiler = cProfile.Profile() if profile else None
+    if _state.profiler is not None:
+        _state.profiler.enable()
+
+
+@contextmanager
+def stage(name, rows=None):
+    stages = getattr(_state, "stages", None)
+    current = Stage(name, rows)
+    if stages is None:
+        yield current
+        return
+
+    tracing = getattr(_state, "tracing", False)
+    if tracing:
+        current._shared, current._joins = _tracing_shared()
+        # The parent's peak so far is kept before the counter is reset for this stage
+        if _state.stack:
+            parent = _state.stack[-1]
+            parent._peak_seen = max(parent._peak_seen, tracemalloc.get_traced_memory()[1])
+        current._start_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    stages.append((len(_state.stack), current))
+    _state.stack.append(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        _state.stack.pop()
+        if tracing:
+            peak = max(current._peak_seen, tracemalloc.get_traced_memory()[1])
+            shared, joins = _tracing_shared()
+            if not (current._shared or shared or joins != current._joins):
+                current.peak_bytes = peak - current._start_bytes
+            if _state.stack:
+                _state.stack[-1]._peak_seen = max(_state.stack[-1]._peak_seen, peak)
+
+
+STAGE_COLUMNS = ["stage", "seconds", "rows", "peak_mb"]
+
+
+def rerun_stages():
+    # Plain rows, pandas is only imported when the debug panel shows them
+    rows = []
+    for depth, current in getattr(_state, "stages", None) or []:
+        rows.append({
+            "stage": "  " * depth + current.name,
+            "seconds": None if current.seconds is None else round(current.seconds, 4),
+            "rows": current.rows,
+            "peak_mb": None if current.peak_bytes is None else round(current.peak_bytes / 1024 ** 2, 2),
+        })
+    return rows
+
+
+def finish_timing():
+    if getattr(_state, "stages", None) is None:
+        return None, rerun_stages()
+    total = time.perf_counter() - _state.start
+
+    profile_path = None
+    if _state.profiler is not None:
+        _state.profiler.disable()
+        # pstats format, readable with snakeviz or python -m pstats
+        profile_path = os.path.join(LOG_DIR, f"{_state.page}_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+        os.makedirs(LOG_DIR, exist_ok=True)
+        _state.profiler.dump_stats(profile_path)
+        _state.profiler = None
+    _stop_tracing()
+
+    summary = " ".join(
+        f"{current.name}={current.seconds:.3f}s" + (f"/{current.rows}rows" if current.rows is not None else "")
+        for depth, current in _state.stages if depth == 0 and current.seconds is not None
+    )
+    _get_logger().info(f"{_state.page} total={total:.3f}s {summary}")
+    stages = rerun_stages()
+    _state.stages = None
+    return profile_path, stages
+
+
+def show_debug_panel():
+    import streamlit as st
+
+    profile_path, stages = finish_timing()
+    if not getattr(_state, "debug", False):
+        return
+    with st.expander("Timings for this rerun", expanded=True):
+        import pandas as pd
+
+        st.dataframe(pd.DataFrame(stages, columns=STAGE_COLUMNS))
+        if any(row["peak_mb"] is None and row["seconds"] is not None for row in stages):
+            st.caption("Peak memory is left out for stages that ran while another session's debug rerun was tracing.")
+        st.caption(f"Log: {os.path.join(LOG_DIR, LOG_FILE)}")
+        if profile_path is not None:
+            st.caption(f"cProfile dump: {profile_path}")
+
+
+def debug_flags():
+    import streamlit as st
+
+    # Opt in with ?debug=1, add &profile=1 for a cProfile dump of the rerun
+    debug = st.query_params.get("debug") == "1" or os.environ.get("ENERGY_DEBUG") == "1"
+    profile = debug and st.query_params.get("profile") == "1"
+    return debug, profile
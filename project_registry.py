@@ -0,0 +1,451 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+# Lives next to the project folders, like folders.json did
+REGISTRY_FILE = os.environ.get("PROJECT_REGISTRY", "projects.db")
+# Imported once into an empty registry, it is never written again
+LEGACY_FOLDERS_FILE = "folders.json"
+
+PROCESSING = "processing"  # upload being converted by a background ingest job
+FAILED = "failed"          # ingest job failed, the error is in its job
+DRAFT = "draft"            # file converted, systems not saved yet
+ACTIVE = "active"
+DELETED = "deleted"        # hidden at once, the folder is removed by collect_garbage()
+
+# Ingest job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+# A queued or running job belongs to the server process that renewed its lease last; once the lease is older
+# than this, the process is taken as gone and another one resumes the job
+JOB_LEASE_SECONDS = 60
+
+# Uploads never saved or failed and folders no project owns are only collected after this long
+DRAFT_TTL_SECONDS = 24 * 3600
+ORPHAN_GRACE_SECONDS = 3600
+# App, tooling and output folders next to the projects, never collected and never a project name
+PROTECTED_DIRS = {"pages", "tests", "reports", "__pycache__"}
+# A project name is its folder name, a single path component
+UNSAFE_NAME_CHARACTERS = ("/", "\\", ":", "\0")
+
+SCHEMA_VERSION = 4
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    source_file TEXT,
+    config_file TEXT,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS projects_status ON projects (status, name);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    owner TEXT,
+    lease REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project, id);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS summaries (
+    project TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    rows INTEGER,
+    first_reading TEXT,
+    last_reading TEXT,
+    days INTEGER,
+    coverage REAL,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS system_summaries (
+    project TEXT NOT NULL,
+    system TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    installation_date TEXT,
+    pre_kwh REAL,
+    post_kwh REAL,
+    pre_points INTEGER,
+    post_points INTEGER,
+    savings REAL,
+    savings_low REAL,
+    savings_high REAL,
+    normalized_savings REAL,
+    normalized_low REAL,
+    normalized_high REAL,
+    message TEXT,
+    PRIMARY KEY (project, analysis, system)
+);
+"""
+# Per system and analysis, as computed by batch_analysis.project_savings()
+SYSTEM_SUMMARY_FIELDS = ["system", "analysis", "installation_date", "pre_kwh", "post_kwh", "pre_points", "post_points", "savings",
+                         "savings_low", "savings_high", "normalized_savings", "normalized_low", "normalized_high", "message"]
+
+
+def validate_name(name):
+    # The name is typed in by the user and becomes a folder the garbage collection may remove
+    if not name or name != name.strip():
+        raise ValueError("An analysis name cannot be empty or start or end with spaces")
+    if any(character in name for character in UNSAFE_NAME_CHARACTERS):
+        raise ValueError("An analysis name cannot contain '/', '\\' or ':'")
+    # Also rules out . and .., like the folders _orphan_folders never considers a project
+    if name.startswith((".", "_")):
+        raise ValueError("An analysis name cannot start with '.' or '_'")
+    if name.lower() in PROTECTED_DIRS:
+        raise ValueError(f"'{name}' is a folder of the app, choose another analysis name")
+    return name
+
+
+class ProjectRegistry:
+    def __init__(self, path=REGISTRY_FILE):
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+        with self._transaction() as connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        connection.execute(statement)
+                if version == 0:
+                    self._import_legacy(connection)
+                columns = [row["name"] for row in connection.execute("PRAGMA table_info(jobs)")]
+                if "lease" not in columns:
+                    # Jobs of older registries have no lease, they count as expired and are resumed once
+                    connection.execute("ALTER TABLE jobs ADD COLUMN lease REAL")
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self):
+        # One short-lived connection per operation, sqlite connections are not shared between session threads
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        # WAL lets the pages read while an upload or delete is being written
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            # Takes the write lock up front, concurrent writers queue on the busy timeout instead of failing mid-way
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def _import_legacy(self, connection):
+        legacy_path = os.path.join(self.root, LEGACY_FOLDERS_FILE)
+        if not os.path.exists(legacy_path):
+            return
+        with open(legacy_path, "r") as folders_json:
+            folders = json.load(folders_json)
+        now = time.time()
+        for name, files in folders.items():
+            source, config = (list(files) + [None, None])[:2]
+            connection.execute(
+                "INSERT OR IGNORE INTO projects (name, source_file, config_file, status, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, source, config, ACTIVE, now, now),
+            )
+
+    @staticmethod
+    def _record(row):
+        if row is None:
+            return None
+        record = dict(row)
+        record["metadata"] = json.loads(record["metadata"])
+        return record
+
+    def get(self, name):
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM projects WHERE name = ?", (name,)).fetchone()
+        finally:
+            connection.close()
+        return self._record(row)
+
+    def projects(self, status=ACTIVE):
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT * FROM projects WHERE status = ? ORDER BY name", (status,)).fetchall()
+        finally:
+            connection.close()
+        return [self._record(row) for row in rows]
+
+    def project_names(self, status=ACTIVE):
+        return [project["name"] for project in self.projects(status)]
+
+    def folder(self, name):
+        # Always a direct child of the registry's folder, also once symlinks are resolved
+        path = os.path.join(self.root, validate_name(name))
+        if os.path.dirname(os.path.realpath(path)) != os.path.realpath(self.root):
+            raise ValueError(f"The folder of '{name}' is outside {self.root}")
+        return path
+
+    def _remove_folder(self, name):
+        try:
+            path = self.folder(name)
+        except ValueError:
+            # A name registered before names were checked, its row goes but nothing is removed from disk
+            return
+        shutil.rmtree(path, ignore_errors=True)
+
+    def register(self, name, source_file, status=PROCESSING, metadata=None):
+        # Re-uploading under an existing name replaces the data file and starts over
+        validate_name(name)
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO projects (name, source_file, config_file, status, created, updated, metadata) VALUES (?, ?, NULL, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET source_file = excluded.source_file, config_file = NULL, status = excluded.status, "
+                "updated = excluded.updated, metadata = excluded.metadata",
+                (name, source_file, status, now, now, json.dumps(metadata or {})),
+            )
+
+    def update(self, name, **fields):
+        if "metadata" in fields:
+            fields["metadata"] = json.dumps(fields["metadata"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._transaction() as connection:
+            cursor = connection.execute(f"UPDATE projects SET {assignments} WHERE name = ?", (*fields.values(), name))
+            if cursor.rowcount == 0:
+                raise KeyError(f"Unknown project: {name}")
+
+    def add_source(self, name, source_file):
+        # An appended data file takes the project back to processing until it is merged
+        with self._transaction() as connection:
+            row = connection.execute("SELECT metadata FROM projects WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown project: {name}")
+            metadata = json.loads(row["metadata"])
+            metadata["appended"] = metadata.get("appended", []) + [source_file]
+            connection.execute(
+                "UPDATE projects SET status = ?, metadata = ?, updated = ? WHERE name = ?",
+                (PROCESSING, json.dumps(metadata), time.time(), name),
+            )
+
+    def drop_source(self, name, source_file, error):
+        # An appended file that could not be merged: the project keeps its data, the file is listed as rejected
+        with self._transaction() as connection:
+            row = connection.execute("SELECT metadata FROM projects WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown project: {name}")
+            metadata = json.loads(row["metadata"])
+            metadata["appended"] = [file for file in metadata.get("appended", []) if file != source_file]
+            metadata["rejected"] = metadata.get("rejected", []) + [{"source": source_file, "error": error}]
+            connection.execute(
+                "UPDATE projects SET metadata = ?, updated = ? WHERE name = ?", (json.dumps(metadata), time.time(), name)
+            )
+
+    def activate(self, name, config_file):
+        # Saving the systems while the upload is still converting keeps it listed as processing
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE projects SET config_file = ?, status = CASE WHEN status IN (?, ?) THEN status ELSE ? END, updated = ? WHERE name = ?",
+                (config_file, PROCESSING, FAILED, ACTIVE, time.time(), name),
+            )
+
+    def finish_processing(self, name, failed=False):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE projects SET status = CASE WHEN ? THEN ? WHEN config_file IS NULL THEN ? ELSE ? END, updated = ? "
+                "WHERE name = ? AND status = ?",
+                (failed, FAILED, DRAFT, ACTIVE, time.time(), name, PROCESSING),
+            )
+
+    def create_job(self, project, owner):
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO jobs (project, status, message, owner, lease, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (project, QUEUED, "Queued", owner, now + JOB_LEASE_SECONDS, now, now),
+            )
+            return cursor.lastrowid
+
+    def update_job(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._transaction() as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get_job(self, job_id):
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            connection.close()
+        return None if row is None else dict(row)
+
+    def latest_job(self, project):
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM jobs WHERE project = ? ORDER BY id DESC LIMIT 1", (project,)).fetchone()
+        finally:
+            connection.close()
+        return None if row is None else dict(row)
+
+    def renew_jobs(self, owner):
+        # Heartbeat of a server process: its queued and running jobs stay its own for another lease
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET lease = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + JOB_LEASE_SECONDS, owner, QUEUED, RUNNING),
+            )
+
+    def claim_orphaned_jobs(self, owner):
+        # Queued or running jobs whose server process stopped renewing their lease, taken over by this one.
+        # Owners are random per-process tokens, a restarted server reusing the same PID is still a new owner
+        now = time.time()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, project FROM jobs WHERE status IN (?, ?) AND owner IS NOT ? AND (lease IS NULL OR lease < ?)",
+                (QUEUED, RUNNING, owner, now),
+            ).fetchall()
+            for row in rows:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, progress = 0, message = ?, owner = ?, lease = ?, updated = ? WHERE id = ?",
+                    (QUEUED, "Queued again, its server process stopped", owner, now + JOB_LEASE_SECONDS, now, row["id"]),
+                )
+        return [(row["id"], row["project"]) for row in rows]
+
+    def delete(self, name):
+        self.update(name, status=DELETED)
+
+    def summary_versions(self):
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT project, version FROM summaries").fetchall()
+        finally:
+            connection.close()
+        return {row["project"]: row["version"] for row in rows}
+
+    def save_summary(self, project, version, summary, systems):
+        # Replaces the project's summary and system rows in one transaction, the portfolio never sees half of it
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO summaries (project, version, rows, first_reading, last_reading, days, coverage, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (project, version, summary.get("rows"), summary.get("first_reading"), summary.get("last_reading"),
+                 summary.get("days"), summary.get("coverage"), summary.get("error"), time.time()),
+            )
+            connection.execute("DELETE FROM system_summaries WHERE project = ?", (project,))
+            connection.executemany(
+                f"INSERT INTO system_summaries (project, {', '.join(SYSTEM_SUMMARY_FIELDS)}) VALUES (?{', ?' * len(SYSTEM_SUMMARY_FIELDS)})",
+                [(project, *(system.get(field) for field in SYSTEM_SUMMARY_FIELDS)) for system in systems],
+            )
+
+    def portfolio(self, analysis):
+        # One row per active project and system for the analysis, projects without systems or with an error included
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT s.project, y.system, y.installation_date, y.pre_kwh, y.post_kwh, y.pre_points, y.post_points, y.savings, "
+                "y.savings_low, y.savings_high, y.normalized_savings, y.message, s.rows, s.first_reading, s.last_reading, "
+                "s.days, s.coverage, s.error, s.updated "
+                "FROM summaries s JOIN projects p ON p.name = s.project "
+                "LEFT JOIN system_summaries y ON y.project = s.project AND y.analysis = ? "
+                "WHERE p.status = ? ORDER BY s.project, y.system",
+                (analysis, ACTIVE),
+            ).fetchall()
+        finally:
+            connection.close()
+        return [dict(row) for row in rows]
+
+    def _orphan_folders(self, known, now):
+        # Imported here, the registry is read on every page load and must not pull in pandas
+        from ingest import SUPPORTED_EXTENSIONS
+
+        orphans = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir(follow_symlinks=False) or entry.name in known or entry.name in PROTECTED_DIRS:
+                continue
+            # .git, .cache, virtualenvs and other dot/underscore folders are never projects
+            if entry.name.startswith((".", "_")):
+                continue
+            # Only folders that look like an upload (a data or config file at the top level)
+            files = [file.name.lower() for file in os.scandir(entry.path) if file.is_file()]
+            if not any(file.endswith(SUPPORTED_EXTENSIONS + (".json",)) for file in files):
+                continue
+            if now - entry.stat().st_mtime < ORPHAN_GRACE_SECONDS:
+                continue
+            orphans.append(entry.name)
+        return orphans
+
+    def collect_garbage(self, dry_run=False):
+        # Explicit step, run after a delete or from cron, never on a page render
+        now = time.time()
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT name FROM projects WHERE status = ? OR (status IN (?, ?) AND updated < ?)",
+                (DELETED, DRAFT, FAILED, now - DRAFT_TTL_SECONDS),
+            ).fetchall()
+            known = {row["name"] for row in connection.execute("SELECT name FROM projects")}
+        finally:
+            connection.close()
+
+        candidates = [row["name"] for row in rows]
+        orphans = self._orphan_folders(known, now)
+        if dry_run:
+            return candidates + orphans
+
+        removed = []
+        for name in candidates:
+            with self._transaction() as connection:
+                # A re-upload under the same name in the meantime keeps the folder
+                cursor = connection.execute(
+                    "DELETE FROM projects WHERE name = ? AND (status = ? OR (status IN (?, ?) AND updated < ?))",
+                    (name, DELETED, DRAFT, FAILED, now - DRAFT_TTL_SECONDS),
+                )
+                if cursor.rowcount:
+                    connection.execute("DELETE FROM jobs WHERE project = ?", (name,))
+                    connection.execute("DELETE FROM summaries WHERE project = ?", (name,))
+                    connection.execute("DELETE FROM system_summaries WHERE project = ?", (name,))
+                    self._remove_folder(name)
+                    removed.append(name)
+        for name in orphans:
+            self._remove_folder(name)
+        return removed + orphans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the project registry and remove deleted or orphaned project folders")
+    parser.add_argument("--registry", default=REGISTRY_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="registered projects and their status")
+    gc = commands.add_parser("gc", help="remove deleted projects, stale drafts and orphaned folders")
+    gc.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    registry = ProjectRegistry(args.registry)
+    if args.command == "list":
+        for status in (ACTIVE, PROCESSING, FAILED, DRAFT, DELETED):
+            for project in registry.projects(status):
+                print(f"{project['name']}\t{status}\t{project['source_file']}\t{project['config_file']}")
+    else:
+        for name in registry.collect_garbage(args.dry_run):
+            print(f"{'would remove' if args.dry_run else 'removed'} {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from processing import POST_INSTALLATION, PRE_INSTALLATION
+
+BOOTSTRAP_RESAMPLES = 2000
+CONFIDENCE = 0.95
+# Resamples per matrix product, keeps the weight matrix to a few MB on multi-year projects
+RESAMPLE_CHUNK = 250
+# Fixed, so the interval does not jitter between reruns of the same selection
+SEED = 0
+
+
+def _block_bin_sums(cube, bin_column, bins):
+    # kWh sum and reading count per day and temperature bin, the day is the resampling unit: readings of an
+    # hour share one hourly average and consecutive hours are correlated, so they cannot be resampled independently
+    blocks = cube.groupby("date", dropna=False, sort=False).ngroup().to_numpy()
+    bin_codes = bins.get_indexer(cube[bin_column])
+    flat = blocks * len(bins) + bin_codes
+    size = (blocks.max() + 1) * len(bins)
+    sums = np.bincount(flat, weights=cube["kwh_sum"].to_numpy(dtype="float64"), minlength=size)
+    counts = np.bincount(flat, weights=cube["kwh_count"].to_numpy(dtype="float64"), minlength=size)
+    return sums.reshape(-1, len(bins)), counts.reshape(-1, len(bins))
+
+
+def _bootstrap(block_sums, block_counts, resamples, rng):
+    # Poisson(1) weight per block and resample, summed into per-bin totals with one matrix product per chunk
+    sums = np.empty((resamples, block_sums.shape[1]))
+    counts = np.empty((resamples, block_sums.shape[1]))
+    for start in range(0, resamples, RESAMPLE_CHUNK):
+        stop = min(start + RESAMPLE_CHUNK, resamples)
+        weights = rng.poisson(1.0, size=(stop - start, len(block_sums))).astype("float64")
+        sums[start:stop] = weights @ block_sums
+        counts[start:stop] = weights @ block_counts
+    return sums, counts
+
+
+def _simple_savings(pre_sums, pre_counts, post_sums, post_counts):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pre_kwh = pre_sums.sum(axis=-1) / pre_counts.sum(axis=-1)
+        post_kwh = post_sums.sum(axis=-1) / post_counts.sum(axis=-1)
+        return (pre_kwh - post_kwh) / pre_kwh * 100
+
+
+def _normalized_savings(pre_sums, pre_counts, post_sums, post_counts, weights):
+    # Both periods evaluated on the same temperature mix, bins missing from a period drop out of both sides
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pre_bin = pre_sums / pre_counts
+        post_bin = post_sums / post_counts
+        valid = np.isfinite(pre_bin) & np.isfinite(post_bin)
+        weights = np.where(valid, weights, 0.0)
+        pre_kwh = np.where(valid, pre_bin, 0.0) * weights
+        post_kwh = np.where(valid, post_bin, 0.0) * weights
+        return (pre_kwh.sum(axis=-1) - post_kwh.sum(axis=-1)) / pre_kwh.sum(axis=-1) * 100
+
+
+def _interval(samples, confidence):
+    samples = samples[np.isfinite(samples)]
+    if len(samples) == 0:
+        return None, None
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(samples, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def savings_estimate(cube, bin_column, value_range=None, resamples=BOOTSTRAP_RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+    # Pre -> Post savings in percent, plain and temperature-bin-normalized, with bootstrap intervals.
+    # A period without data gives None values and a message instead of an exception.
+    cube = cube[cube[bin_column].notna() & (cube["kwh_count"] > 0)]
+    if value_range is not None:
+        cube = cube[(cube[bin_column] >= value_range[0]) & (cube[bin_column] <= value_range[1])]
+
+    bins = pd.Index(np.sort(cube[bin_column].unique()))
+    pre = cube[cube["Installation_Type"] == PRE_INSTALLATION]
+    post = cube[cube["Installation_Type"] == POST_INSTALLATION]
+    result = {
+        "pre_kwh": None, "post_kwh": None,
+        "pre_points": int(pre["size"].sum()), "post_points": int(post["size"].sum()),
+        "savings": None, "savings_low": None, "savings_high": None,
+        "normalized_savings": None, "normalized_low": None, "normalized_high": None,
+        "bins": 0, "resamples": resamples, "confidence": confidence, "message": None,
+    }
+    missing = [period for period, part in ((PRE_INSTALLATION, pre), (POST_INSTALLATION, post)) if part.empty]
+    if missing:
+        result["message"] = f"No {' or '.join(missing)} readings in the selected range"
+        return result
+
+    pre_sums, pre_counts = _block_bin_sums(pre, bin_column, bins)
+    post_sums, post_counts = _block_bin_sums(post, bin_column, bins)
+    pre_total, pre_total_counts = pre_sums.sum(axis=0), pre_counts.sum(axis=0)
+    post_total, post_total_counts = post_sums.sum(axis=0), post_counts.sum(axis=0)
+    # Weighted by the readings of both periods in each bin
+    weights = pre_total_counts + post_total_counts
+
+    result["pre_kwh"] = float(pre_total.sum() / pre_total_counts.sum())
+    result["post_kwh"] = float(post_total.sum() / post_total_counts.sum())
+    result["savings"] = float(_simple_savings(pre_total, pre_total_counts, post_total, post_total_counts))
+    normalized = float(_normalized_savings(pre_total, pre_total_counts, post_total, post_total_counts, weights))
+    result["normalized_savings"] = normalized if np.isfinite(normalized) else None
+    result["bins"] = int(((pre_total_counts > 0) & (post_total_counts > 0)).sum())
+    if result["bins"] == 0:
+        result["message"] = "No temperature bin has readings in both periods, normalized savings cannot be computed"
+
+    rng = np.random.default_rng(seed)
+    boot_pre_sums, boot_pre_counts = _bootstrap(pre_sums, pre_counts, resamples, rng)
+    boot_post_sums, boot_post_counts = _bootstrap(post_sums, post_counts, resamples, rng)
+    result["savings_low"], result["savings_high"] = _interval(
+        _simple_savings(boot_pre_sums, boot_pre_counts, boot_post_sums, boot_post_counts), confidence)
+    if result["normalized_savings"] is not None:
+        result["normalized_low"], result["normalized_high"] = _interval(
+            _normalized_savings(boot_pre_sums, boot_pre_counts, boot_post_sums, boot_post_counts, weights), confidence)
+    return result
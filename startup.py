@@ -0,0 +1,80 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+
+# What main.py imports before its first render, none of it may pull in the analytics stack
+LANDING_MODULES = ["streamlit", "profiling", "project_registry", "ingest_jobs"]
+# What the analysis page needs, imported on demand or by the background warm-up
+ANALYTICS_MODULES = ["numpy", "pandas", "pyarrow.parquet", "altair", "data_store", "processing", "savings", "baseline",
+                     "dataset_cache", "chart_data", "data_grid"]
+HEAVY_MODULES = ["numpy", "pandas", "pyarrow", "altair", "matplotlib"]
+
+# Set ENERGY_WARMUP=0 to only import the analytics stack when a page first needs it
+WARMUP = os.environ.get("ENERGY_WARMUP", "1") != "0"
+
+_warmup_started = False
+_lock = threading.Lock()
+
+
+def _import_all(modules):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            # A missing optional module fails again, with its message, where it is actually used
+            pass
+
+
+def warm_up(modules=ANALYTICS_MODULES):
+    # Once per server process and after the landing page has rendered, so it never delays the first paint
+    global _warmup_started
+    with _lock:
+        if _warmup_started or not WARMUP:
+            return
+        _warmup_started = True
+    threading.Thread(target=_import_all, args=(modules,), name="analytics-warmup", daemon=True).start()
+
+
+def import_times(modules, python=sys.executable):
+    # Cold import of the modules together in a fresh interpreter, from python -X importtime
+    code = f"import sys; {'; '.join(f'import {module}' for module in modules)}; print(','.join(sorted(sys.modules)))"
+    result = subprocess.run([python, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, total, name = line[len("import time:"):].split("|")
+        # Top-level imports only, nested ones are part of their parent's cumulative time
+        if not name[1:].startswith(" "):
+            cumulative[name.strip()] = int(total) / 1e6
+    loaded = set(result.stdout.strip().split(","))
+    return {
+        "seconds": round(sum(cumulative[module] for module in modules if module in cumulative), 3),
+        "modules": {module: round(cumulative.get(module, 0.0), 3) for module in modules},
+        "heavy_loaded": [module for module in HEAVY_MODULES if module in loaded],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold import time of the landing page and of the analytics stack")
+    parser.add_argument("--output", default=None, help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = {"landing": import_times(LANDING_MODULES), "analytics": import_times(ANALYTICS_MODULES)}
+    for name, times in report.items():
+        print(f"{name}: {times['seconds']:.3f}s, heavy modules loaded: {', '.join(times['heavy_loaded']) or 'none'}")
+        for module, seconds in times["modules"].items():
+            print(f"  {module:<20}{seconds:>8.3f}s")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
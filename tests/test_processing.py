@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from processing import INSTALLATION_TYPES, add_m_round_columns, installation_period, m_round_bin
+
+M_ROUNDS = [0.25, 0.3, 0.5, 1, 2]
+INSTALLATION_DATE = "2024-03-15"
+
+
+# The row-wise versions show_input_values used before the vectorized kernels
+def legacy_m_round(values, m_round):
+    return pd.Series(values, dtype="float64").apply(lambda x: m_round * round(x / m_round) if not np.isnan(x) else np.nan)
+
+
+def legacy_installation_type(time_stamps, instl_dt):
+    def compare_date(x):
+        if pd.to_datetime(x) > pd.to_datetime(instl_dt):
+            return "Post Installation"
+        else:
+            return "Pre Installation"
+
+    return pd.Series(time_stamps).apply(lambda x: compare_date(x))
+
+
+def meter_frame(rows=5000, seed=0):
+    # Readings with the meters' one decimal, ∆T lands on every .5 tie of the coarser m_round values
+    rng = np.random.default_rng(seed)
+    temp_out = np.round(rng.uniform(15, 40, rows), 1)
+    temp_gate = np.round(rng.uniform(15, 30, rows), 1)
+    temp_out[::97] = np.nan
+    temp_gate[::89] = np.nan
+    time_stamps = pd.Series(pd.Timestamp("2024-03-14") + pd.to_timedelta(rng.integers(0, 3 * 24 * 60, rows), unit="min"))
+    time_stamps.iloc[0] = pd.Timestamp(INSTALLATION_DATE)
+    time_stamps.iloc[1] = pd.NaT
+    return pd.DataFrame({"Time_stamp": time_stamps, "TEMP_OUT": temp_out, "TEMP_GATE": temp_gate})
+
+
+@pytest.mark.parametrize("m_round", M_ROUNDS)
+def test_m_round_bin_matches_apply(m_round):
+    values = np.concatenate([
+        np.arange(-10, 10, 0.125),
+        # Exact halves of m_round round to the even multiple, like Python's round()
+        (np.arange(-20, 20) + 0.5) * m_round,
+        [np.nan, 0.0, -0.0],
+    ])
+    expected = legacy_m_round(values, m_round).to_numpy()
+    np.testing.assert_array_equal(m_round_bin(values, m_round), expected)
+
+
+def test_m_round_bin_ties_round_half_to_even():
+    np.testing.assert_array_equal(m_round_bin([0.25, 0.75, 1.25, -0.25], 0.5), [0.0, 1.0, 1.0, -0.0])
+    np.testing.assert_array_equal(m_round_bin([0.5, 1.5, 2.5], 1), [0.0, 2.0, 2.0])
+
+
+def test_m_round_bin_keeps_nan():
+    assert np.isnan(m_round_bin([np.nan], 0.5)).all()
+
+
+def test_installation_period_matches_compare_date():
+    time_stamps = pd.Series([
+        pd.Timestamp("2024-03-14 23:59:59"), pd.Timestamp(INSTALLATION_DATE), pd.Timestamp("2024-03-15 00:00:01"),
+        pd.Timestamp("2024-03-16 12:00:00"), pd.NaT,
+    ])
+    labels = installation_period(time_stamps, INSTALLATION_DATE)
+    assert list(labels.categories) == INSTALLATION_TYPES
+    assert list(labels) == list(legacy_installation_type(time_stamps, INSTALLATION_DATE))
+    # A reading exactly at the installation date and a missing time stamp are both Pre
+    assert list(labels) == ["Pre Installation", "Pre Installation", "Post Installation", "Post Installation", "Pre Installation"]
+
+
+@pytest.mark.parametrize("m_round", M_ROUNDS)
+def test_add_m_round_columns_matches_apply(m_round):
+    legacy = meter_frame()
+    legacy["∆T"] = legacy["TEMP_OUT"] - legacy["TEMP_GATE"]
+    for column in ["∆T", "TEMP_OUT", "TEMP_GATE"]:
+        legacy[f"{column} M_ROUND"] = legacy_m_round(legacy[column], m_round)
+    legacy["Installation_Type"] = legacy_installation_type(legacy["Time_stamp"], INSTALLATION_DATE)
+
+    # Temperatures are stored as float32 since the compact schema
+    df = meter_frame().astype({"TEMP_OUT": "float32", "TEMP_GATE": "float32"})
+    df = add_m_round_columns(df, m_round, INSTALLATION_DATE)
+
+    for column in ["∆T M_ROUND", "TEMP_OUT M_ROUND", "TEMP_GATE M_ROUND"]:
+        np.testing.assert_array_equal(df[column].to_numpy(), legacy[column].to_numpy(), err_msg=column)
+    assert list(df["Installation_Type"].astype(str)) == list(legacy["Installation_Type"])